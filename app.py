@@ -1,60 +1,179 @@
-from flask import Flask, render_template
+from flask import Flask, Response, abort, jsonify, render_template, request
 from flask_socketio import SocketIO
 from sensors_logic import LogicHandler
+from streaming import Decimator, channel_names, channel_rows, tick_encoder
+from hub import BroadcastHub
+from metrics import REGISTRY
+from recording import open_index
 from threading import Thread, Event
+import logging
+import os
 import threading
 import time
+import numpy as np
 
 app = Flask(__name__)
 socketio = SocketIO(app, async_mode='threading')
 
+log = logging.getLogger(__name__)
 logic_handler = LogicHandler()
 stop_event = Event()
 
+STREAM_INTERVAL = float(os.environ.get("MACPARKMAN_STREAM_INTERVAL", 0.05))  # s between binary frames
+SNAPSHOT_INTERVAL = 0.1  # s between the plain 'sensor_data' updates
+MAX_WIDTH = 10000  # points a range query may ask for
+
+# Recordings (*.rec) served by /sessions, by default next to MACPARKMAN_RECORD
+SESSIONS_DIR = os.environ.get("MACPARKMAN_SESSIONS") or os.path.dirname(os.path.abspath(os.environ.get("MACPARKMAN_RECORD", "session.rec")))
+_indexes = {}  # path -> (mtime, Pyramid)
+
+# Everything for the viewers goes through the hub, so a slow one never holds
+# up this process; MACPARKMAN_STREAM_POLICY is "drop-oldest" or "latest".
+# Impacts are individual events, so they are never coalesced away.
+hub = BroadcastHub(socketio.emit, os.environ.get("MACPARKMAN_STREAM_POLICY", "drop-oldest"), reliable=('impact',))
+
 @app.route('/')
 def index():
     return render_template('dashboard.html')
 
+@app.route('/metrics')
+def metrics():
+    # Ingest counters and latency histograms for Prometheus or a quick curl
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/clients')
+def clients():
+    # Per-viewer queue depth, lag and dropped message counts
+    return jsonify(hub.stats())
+
+@app.route('/events')
+def events():
+    # Recently captured threshold crossings, newest last
+    return jsonify(logic_handler.event_capture.recent_events(50))
+
+@app.route('/calibration')
+def calibration():
+    # Per-board matrices and offsets, plus the filter chain
+    calibration = logic_handler.calibration
+    return jsonify({
+        "sensors": {device: {"matrix": calibration.matrices[device].tolist(), "offset": calibration.offsets[device].tolist()} for device in calibration.matrices},
+        "filters": calibration.filters,
+    })
+
+@app.route('/calibration/zero', methods=['POST'])
+def calibration_zero():
+    # Auto-zero the active sensors on their last second; ?save=1 writes the
+    # result to the calibration file
+    zeroed, moving = logic_handler.auto_zero(save=request.args.get("save") == "1")
+    return jsonify({"zeroed": [sensor.port for sensor in zeroed], "moving": [sensor.port for sensor in moving]})
+
+@app.route('/sessions')
+def sessions():
+    # Recorded sessions that /sessions/<name>/range can read
+    names = sorted(name for name in os.listdir(SESSIONS_DIR) if name.endswith('.rec'))
+    return jsonify(names)
+
+def session_index(name):
+    # The pyramid for a recording: the recorder's own while it is still being
+    # written, otherwise the saved one, cached until the file changes
+    path = os.path.join(SESSIONS_DIR, name)
+    if name != os.path.basename(name) or not name.endswith('.rec') or not os.path.isfile(path):
+        abort(404)
+    recorder = logic_handler.sensor_manager.recorder
+    if recorder and os.path.abspath(recorder.path) == os.path.abspath(path):
+        return recorder.index
+    mtime = os.path.getmtime(path)
+    cached = _indexes.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _indexes[path] = (mtime, open_index(path))
+    return cached[1]
+
+@app.route('/sessions/<name>/range')
+def session_range(name):
+    # ?start=&end= in seconds from the start of the session, width in points
+    # (the plot's pixels) and optionally ports=1,3. Each point is the min,
+    # max and mean magnitude of a slice, read from the coarsest pyramid level
+    # that still resolves it (the ends from finer ones, see Pyramid.query),
+    # so an hour costs the same as a second.
+    index = session_index(name)
+    try:
+        start = float(request.args.get("start", 0))
+        end = float(request.args.get("end", index.duration))
+        width = min(int(request.args.get("width", 800)), MAX_WIDTH)
+        ports = request.args.get("ports")
+        result = index.query(start, end, width, [int(port) for port in ports.split(",")] if ports else None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def values(array):
+        # JSON has no NaN; empty slices come out as null
+        return np.where(np.isnan(array), None, np.round(array.astype(float), 4)).T.tolist()
+    return jsonify({
+        "start": result["start"], "dt": result["dt"], "level": result["level"], "duration": index.duration,
+        "ports": result["channels"],
+        "min": values(result["min"]), "max": values(result["max"]), "mean": values(result["mean"]),
+    })
+
 def sensor_data_thread():
-    print("Starting sensor data thread") # TODO: Delete
     logic_handler.connect_to_sensors()
+    impacts_sent = 0
+    next_snapshot = 0
+    # Wakes when samples arrive but at most every STREAM_INTERVAL, so each
+    # frame carries everything since the last one; quiet sensors let it sleep
+    pacer = logic_handler.pacer(STREAM_INTERVAL)
     try:
         while not stop_event.is_set():
-            external_xyz, internal_xyz = logic_handler.read_xyz_data()
-            external_mag = logic_handler.calculate_magnitude(external_xyz)
-            internal_mag = logic_handler.calculate_magnitude(internal_xyz)
-
-            data = {
-                "external": {
-                    "x": external_xyz[0],
-                    "y": external_xyz[1],
-                    "z": external_xyz[2],
-                    "magnitude": external_mag
-                },
-                "internal": {
-                    "x": internal_xyz[0],
-                    "y": internal_xyz[1],
-                    "z": internal_xyz[2],
-                    "magnitude": internal_mag
-                }
-            }
-            # print(external_xyz) # TODO: Delete
-
-            socketio.emit('sensor_data', {'x': external_xyz[0], 'y': external_xyz[1], 'z': external_xyz[2]})
-            time.sleep(0.1)
+            if not pacer.wait(stop_event):
+                # Nothing new, but an event capture of a sensor that went quiet may be due
+                logic_handler.process_samples()
+                continue
+            # Every fused tick since the last pass is published once; each
+            # viewer's hub thread decimates it into that viewer's frame
+            batches = logic_handler.read_xyz_batches()
+            if len(batches[0]):
+                hub.publish('ticks', (float(batches[0]['t'][0]), channel_rows(*batches)))
+
+            now = time.monotonic()
+            if now >= next_snapshot:
+                next_snapshot = now + SNAPSHOT_INTERVAL
+                # The first group, like the external column always was; the
+                # samples were already processed for the batches above
+                x, y, z = logic_handler.latest_xyz()[0]
+                hub.publish('sensor_data', {'x': x, 'y': y, 'z': z})
+            for impact in logic_handler.impact_monitor.since(impacts_sent):
+                hub.publish('impact', impact)
+            impacts_sent = logic_handler.impact_monitor.impact_count
     except KeyboardInterrupt:
         logic_handler.close_sensors()
 
+@socketio.on('subscribe')
+def handle_subscribe(options):
+    # options: {"mode": "envelope", "points_per_second": <trace px / seconds shown>}
+    # or {"mode": "full"} for every tick, plus an optional queue "policy"
+    options = options or {}
+    if not isinstance(options, dict):
+        return {"error": "subscribe options must be an object"}
+    try:
+        channels = channel_names(logic_handler.groups)
+        decimator = Decimator(logic_handler.fusion.rate, options.get("mode", "envelope"), float(options.get("points_per_second", 100)), len(channels))
+        hub.add(request.sid, options.get("policy"), tick_encoder(decimator))
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    return {"channels": channels, "rate": logic_handler.fusion.rate, "bucket": decimator.bucket}
+
 @socketio.on('connect')
 def handle_connect():
-    print("Client connected.")
+    hub.add(request.sid, prepare=tick_encoder())
+    log.info("Client %s connected", request.sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print("Client disconnected.")
+    hub.remove(request.sid)
+    log.info("Client %s disconnected", request.sid)
 
 if __name__ == "__main__":
-    print("Starting main program")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    log.info("Starting sensor data thread")
     thread = threading.Thread(target=sensor_data_thread)
     thread.daemon = True
     thread.start()
@@ -63,5 +182,6 @@ if __name__ == "__main__":
     finally:
         stop_event.set()
         thread.join()
-        logic_handler.close_sensors
+        hub.close()
+        logic_handler.close_sensors()
 
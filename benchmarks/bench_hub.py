@@ -0,0 +1,97 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub import BroadcastHub
+from sensors_logic import LogicHandler
+from streaming import Decimator, channel_rows, tick_encoder
+from transports import SyntheticTransport
+
+class SimulatedClients:
+    # Stands in for socketio.emit with a crowd of local viewers: "fast" ones
+    # take each message instantly, "slow" ones need `delay` seconds per
+    # message (a weak Wi-Fi link) and "stalled" ones block until the run ends
+    def __init__(self, kinds, delay):
+        self.kinds = kinds  # sid -> kind
+        self.delay = delay
+        self.received = {sid: 0 for sid in kinds}
+        self.released = threading.Event()
+
+    def emit(self, event, payload, to=None):
+        kind = self.kinds[to]
+        if kind == "slow":
+            time.sleep(self.delay)
+        elif kind == "stalled":
+            self.released.wait()
+        self.received[to] += 1
+
+def run(clients, slow, stalled, policy, interval, seconds, ports, rate, delay):
+    kinds = {f"client{i}": "stalled" if i < stalled else "slow" if i < stalled + slow else "fast" for i in range(clients)}
+    crowd = SimulatedClients(kinds, delay)
+    hub = BroadcastHub(crowd.emit, policy)
+    transports = [SyntheticTransport(rate, name=f"synthetic{i}", seed=i) for i in range(ports)]
+    logic = LogicHandler("threads", transports, events_dir=os.devnull)
+    for sid in kinds:
+        hub.add(sid, prepare=tick_encoder(Decimator(logic.fusion.rate, "envelope", 80)))
+    logic.connect_to_sensors()
+
+    # The same loop app.py runs, minus the network
+    publish_times = []
+    ticks = 0
+    started = time.monotonic()
+    while time.monotonic() - started < seconds:
+        batches = logic.read_xyz_batches()
+        if len(batches[0]):
+            ticks += len(batches[0])
+            before = time.perf_counter()
+            hub.publish('ticks', (float(batches[0]['t'][0]), channel_rows(*batches)))
+            publish_times.append(time.perf_counter() - before)
+        time.sleep(interval)
+    elapsed = time.monotonic() - started
+
+    stats = {entry["sid"]: entry for entry in hub.stats()}
+    received = dict(crowd.received)
+    crowd.released.set()
+    hub.close()
+    logic.close_sensors()
+
+    publish_ms = np.array(publish_times or [0.0]) * 1000
+    sent = sum(transport.lines_sent for transport in transports)
+    lost = sum(transport.dropped_lines for transport in transports) + logic.sensor_manager.dropped_samples
+    print(f"{clients} clients ({slow} slow, {stalled} stalled), policy {policy}: "
+          f"{hub.published} batches, publish p50 {np.percentile(publish_ms, 50):.3f} ms, p99 {np.percentile(publish_ms, 99):.3f} ms")
+    print(f"  acquisition: {sent} lines sent, {lost} lost, {ticks / elapsed:,.0f} fused ticks/s")
+    for kind in ("fast", "slow", "stalled"):
+        group = [sid for sid in kinds if kinds[sid] == kind]
+        if not group:
+            continue
+        frames = [received[sid] for sid in group]
+        dropped = [stats[sid]["dropped"] for sid in group]
+        # max_lag is taken when a message is sent, lag is the age of what's still queued
+        lag = [max(stats[sid]["max_lag"], stats[sid]["lag"]) for sid in group]
+        print(f"  {kind:>8}: frames {min(frames)}-{max(frames)}, dropped {min(dropped)}-{max(dropped)}, "
+              f"max lag {max(lag) * 1000:.0f} ms, queued {max(stats[sid]['queued'] for sid in group)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fan-out cost and per-client backpressure with simulated dashboard viewers")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--slow", type=int, default=5, help="viewers that take --delay seconds per message")
+    parser.add_argument("--stalled", type=int, default=2, help="viewers that never take a message")
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--policy", default="drop-oldest", choices=("drop-oldest", "latest"))
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between published batches")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--ports", type=int, default=2)
+    parser.add_argument("--rate", type=int, default=1000)
+    args = parser.parse_args()
+
+    for clients in args.clients:
+        stalled = min(args.stalled, clients)
+        run(clients, min(args.slow, clients - stalled), stalled, args.policy, args.interval, args.seconds,
+            args.ports, args.rate, args.delay)
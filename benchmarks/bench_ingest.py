@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensors_logic import LogicHandler
+from transports import SyntheticTransport
+
+def run(mode, ports, rate, seconds):
+    # Drive LogicHandler the way the display does (a snapshot at ~60 Hz plus
+    # every new batch) with synthetic boards feeding every port
+    transports = [SyntheticTransport(rate, name=f"synthetic{i}", seed=i) for i in range(ports)]
+    logic = LogicHandler(mode, transports)
+    manager = logic.sensor_manager
+    logic.connect_to_sensors()
+
+    received = {sensor.port: 0 for sensor in manager.sensors}
+    latencies = []
+    started = time.monotonic()
+    while time.monotonic() - started < seconds:
+        logic.read_xyz_data()
+        batches = manager.collect_new_samples()
+        # Latency is how long a sample took to reach this consumer, not its
+        # interpolated t, which can sit before or after the real arrival
+        read_at = time.monotonic()
+        for sensor, samples in batches.items():
+            # Match each sample to the write that carried it on the device side
+            log = np.array(sensor.transport.sent_log)
+            index = received[sensor.port] + np.arange(len(samples))
+            batch = np.minimum(np.searchsorted(log[:, 0], index, side='right'), len(log) - 1)
+            latencies.append(read_at - log[batch, 1])
+            received[sensor.port] += len(samples)
+        time.sleep(1 / 60)
+    elapsed = time.monotonic() - started
+    logic.close_sensors()
+    # Whatever was still in the rings when we stopped counts as received
+    for sensor, samples in manager.collect_new_samples().items():
+        received[sensor.port] += len(samples)
+
+    sent = sum(transport.lines_sent for transport in transports)
+    total = sum(received.values())
+    latencies = np.concatenate(latencies) * 1000 if latencies else np.zeros(1)
+    # Dropped: pipe overruns on the device side, lines that arrived corrupted
+    # and samples the ring overwrote before we read them. The rest of the gap
+    # between sent and received was still in flight when we stopped.
+    dropped = sum(transport.dropped_lines for transport in transports)
+    dropped += sum(sensor.malformed_lines for sensor in manager.sensors) + manager.dropped_samples
+    print(f"{mode:>8} {ports:>5} {rate:>7} {sent:>9} {total / elapsed:>12,.0f} {dropped:>8} {sent - total - dropped:>9} "
+          f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sustained ingest throughput, drops and latency with synthetic boards")
+    parser.add_argument("--ports", type=int, default=8)
+    parser.add_argument("--rates", type=int, nargs="+", default=[100, 1000, 5000, 10000])
+    parser.add_argument("--modes", nargs="+", default=["threads", "selector"])
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'ports':>5} {'rate':>7} {'sent':>9} {'lines/sec':>12} {'dropped':>8} {'in flight':>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for mode in args.modes:
+        for rate in args.rates:
+            run(mode, args.ports, rate, args.seconds)
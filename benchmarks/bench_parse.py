@@ -0,0 +1,45 @@
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensors_logic import parse_lines
+
+LINE = b"01/07/2000,00:01:55.12,-0.04,0.01,1.02,24.390,\r\n"
+
+def legacy_parse(chunk):
+    # The old Sensor.read_data path: one readline/decode/split per line
+    stream = io.BytesIO(chunk)
+    x = y = z = 0
+    while True:
+        raw = stream.readline()
+        if not raw:
+            break
+        line = raw.decode('utf-8').strip()
+        if line:
+            parts = line.split(',')
+            try:
+                if len(parts) >= 5:
+                    x = float(parts[2])
+                    y = float(parts[3])
+                    z = float(parts[4])
+            except (ValueError, TypeError):
+                pass
+    return x, y, z
+
+def bench(name, fn, chunk, lines, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {lines * repeat / elapsed:12,.0f} lines/sec")
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    chunk = LINE * lines
+    print(f"{lines} lines per batch, {repeat} batches")
+    bench("legacy", legacy_parse, chunk, lines, repeat)
+    bench("batch", lambda c: parse_lines(c, 0.0), chunk, lines, repeat)
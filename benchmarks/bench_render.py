@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+from display import Game
+from sensors_logic import LogicHandler
+from transports import SyntheticTransport
+
+VIEWS = ("grid", "oscilloscope", "sensors", "spectrum", "boards")
+
+def make_logic(args):
+    # Returns the LogicHandler and the synthetic transports feeding it, if any.
+    # Impacts go past the yellow threshold, so their captures go to a scratch directory.
+    events_dir = tempfile.mkdtemp(prefix="bench-render-")
+    if args.replay:
+        return LogicHandler("threads", replay=args.replay, replay_speed=1.0, events_dir=events_dir), []
+    transports = [SyntheticTransport(args.rate, name=f"synthetic{i}", seed=i) for i in range(args.ports)]
+    return LogicHandler("threads", transports, events_dir=events_dir), transports
+
+def run_view(game, view, args, transports):
+    game.view_mode = view
+    frame_time = 1 / args.fps if args.fps else 0
+    for _ in range(args.warmup):
+        game.draw_frame()
+    phases = []
+    totals = []
+    for i in range(args.frames):
+        if transports and args.impact_every and i % args.impact_every == 0:
+            transports[i // args.impact_every % len(transports)].inject_impact(peak=8.0, duration=0.02)
+        started = time.perf_counter()
+        phases.append(game.draw_frame())
+        elapsed = time.perf_counter() - started
+        totals.append(elapsed)
+        if args.out and args.save_every and i % args.save_every == 0:
+            pygame.image.save(game.screen, os.path.join(args.out, f"{view}-{i:05d}.png"))
+        # Keep the feed's pace realistic: a frame sees ~1/fps seconds of new data
+        if frame_time > elapsed:
+            time.sleep(frame_time - elapsed)
+
+    totals = np.array(totals) * 1000
+    phases = np.array(phases) * 1000
+    print(f"{view:>12} {np.percentile(totals, 50):>8.2f} {np.percentile(totals, 90):>8.2f} {np.percentile(totals, 99):>8.2f} "
+          f"{totals.max():>8.2f} {phases[:, 0].mean():>8.2f} {phases[:, 1].mean():>8.2f} {phases[:, 2].mean():>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless frame-time percentiles for each display view")
+    parser.add_argument("--views", nargs="+", default=list(VIEWS), choices=VIEWS)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--fps", type=float, default=60, help="pace frames like the real loop (0: as fast as possible)")
+    parser.add_argument("--ports", type=int, default=4)
+    parser.add_argument("--rate", type=int, default=1000, help="lines per second per synthetic board")
+    parser.add_argument("--impact-every", type=int, default=60, help="frames between injected impacts (0: none)")
+    parser.add_argument("--replay", help="drive the views from a recorded session instead")
+    parser.add_argument("--full-redraw", action="store_true", help="redraw and flip the whole screen every frame")
+    parser.add_argument("--out", help="directory for sampled frames")
+    parser.add_argument("--save-every", type=int, default=60)
+    args = parser.parse_args()
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    logic, transports = make_logic(args)
+    game = Game(dirty_rects=not args.full_redraw, headless=True, logic=logic)
+    logic.connect_to_sensors()
+    if transports:
+        # Split the boards across the groups so every panel has something to draw
+        for i, sensor in enumerate(logic.sensor_manager.sensors):
+            sensor.column = logic.groups[i % len(logic.groups)]
+
+    print(f"{'view':>12} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'read':>8} {'draw':>8} {'flip':>8}")
+    try:
+        for view in args.views:
+            run_view(game, view, args, transports)
+    finally:
+        logic.close_sensors()
+        pygame.quit()
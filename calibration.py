@@ -0,0 +1,88 @@
+import json
+import numpy as np
+from filters import FilterBank, design
+
+STILL_LIMIT = 0.05  # g, the most any axis may wobble during auto-zero
+ZERO_SECONDS = 1.0  # s of samples auto-zero averages over
+
+class Calibration:
+    # Per-board corrections applied to every sample before fusion:
+    #   corrected = matrix @ (raw - offset)
+    # where the matrix holds scale and mounting orientation and the offset
+    # is the board's bias. Boards are keyed by device name (COM3,
+    # /dev/ttyACM0); ones without an entry pass through unchanged. The file
+    # can also list the filters run on every sensor after fusion:
+    #   {"sensors": {"COM3": {"matrix": [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+    #                         "offset": [0.01, -0.02, 0.0]}},
+    #    "filters": [{"type": "cfc", "class": 60}]}
+    def __init__(self, sensors=None, filters=()):
+        self.matrices = {}
+        self.offsets = {}
+        self.filters = list(filters)
+        for device, entry in (sensors or {}).items():
+            self.set(device, entry.get("matrix", np.eye(3)), entry.get("offset", (0.0, 0.0, 0.0)))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            config = json.load(file)
+        return cls(config.get("sensors"), config.get("filters", ()))
+
+    def save(self, path):
+        config = {
+            "sensors": {device: {"matrix": self.matrices[device].tolist(), "offset": self.offsets[device].tolist()} for device in self.matrices},
+            "filters": self.filters,
+        }
+        with open(path, 'w') as file:
+            json.dump(config, file, indent=2)
+
+    def set(self, device, matrix, offset):
+        matrix = np.asarray(matrix, dtype=float)
+        offset = np.asarray(offset, dtype=float)
+        if matrix.shape != (3, 3) or offset.shape != (3,):
+            raise ValueError(f"{device}: need a 3x3 matrix and 3 offsets")
+        self.matrices[device] = matrix
+        self.offsets[device] = offset
+
+    def filter_bank(self, rate):
+        return FilterBank([design(spec, rate) for spec in self.filters])
+
+    def apply(self, batches):
+        # Corrects {sensor: samples} in place, every sensor's batch in one
+        # (N, 3) operation; returns the same dict
+        sensors = [sensor for sensor in batches if sensor.device in self.matrices]
+        if not sensors:
+            return batches
+        sizes = [len(batches[sensor]) for sensor in sensors]
+        xyz = np.concatenate([np.column_stack((batches[s]['x'], batches[s]['y'], batches[s]['z'])) for s in sensors])
+        corrected = self.correct([sensor.device for sensor in sensors], sizes, xyz)
+        for sensor, part in zip(sensors, np.split(corrected, np.cumsum(sizes)[:-1])):
+            samples = batches[sensor]
+            samples['x'] = part[:, 0]
+            samples['y'] = part[:, 1]
+            samples['z'] = part[:, 2]
+        return batches
+
+    def correct(self, devices, sizes, xyz):
+        # xyz holds sizes[i] rows from devices[i] in turn, all of them known
+        which = np.repeat(np.arange(len(devices)), sizes)
+        matrices = np.stack([self.matrices[device] for device in devices])[which]
+        offsets = np.stack([self.offsets[device] for device in devices])[which]
+        return np.einsum('nij,nj->ni', matrices, xyz - offsets)
+
+    def auto_zero(self, windows, still=STILL_LIMIT):
+        # windows: {sensor: raw samples taken while the rig stood still}.
+        # Each still sensor's offset becomes its mean reading, so it reads
+        # zero at rest; the matrix is kept. Returns (zeroed, moving) sensors;
+        # a sensor that wobbled more than `still` g is left alone.
+        zeroed, moving = [], []
+        for sensor, samples in windows.items():
+            if len(samples) < 2:
+                continue
+            xyz = np.column_stack((samples['x'], samples['y'], samples['z']))
+            if xyz.std(axis=0).max() > still:
+                moving.append(sensor)
+                continue
+            self.set(sensor.device, self.matrices.get(sensor.device, np.eye(3)), xyz.mean(axis=0))
+            zeroed.append(sensor)
+        return zeroed, moving
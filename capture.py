@@ -0,0 +1,136 @@
+import collections
+import os
+import queue
+import threading
+import time
+import numpy as np
+from impact import resultant
+from recording import RECORD_DTYPE, SAMPLE_FIELDS, write_header
+from samples import SampleRing
+
+MAX_EVENTS = 50
+
+# What write_header needs to know about the sensor, as it was at the trigger
+_SensorInfo = collections.namedtuple("_SensorInfo", "port device column")
+
+class _CaptureState:
+    def __init__(self, capacity):
+        self.ring = SampleRing(capacity)  # pre-trigger history
+        self.was_above = False
+        self.event = None
+        self.parts = []
+        self.sensor = None  # _SensorInfo of the open event
+
+class EventCapture:
+    # Saves the full-rate samples from `pre` seconds before to `post` seconds
+    # after every crossing of a sensor's threshold (by default the display's
+    # yellow level for the sensor's column). Each sensor keeps a pre-trigger
+    # ring; finished windows go to a background worker that writes them as
+    # small session recordings, so they can also be replayed like one. A
+    # window is finished by the sensor's own samples or, if it went quiet, by
+    # tick() once `grace` seconds past its end; close() flushes open ones.
+    # File names carry the process id, since in shared mode the display and
+    # app.py each capture into the same directory.
+    def __init__(self, directory="events", pre=0.5, post=1.0, threshold=2.0, capacity=16384, grace=0.25):
+        self.directory = directory
+        self.pre = pre
+        self.post = post
+        self.grace = grace
+        self.default_threshold = threshold
+        self.thresholds = {}
+        self.capacity = capacity  # pre-trigger samples per sensor, covers `pre` up to capacity / pre Hz
+        self.events = collections.deque(maxlen=MAX_EVENTS)
+        self.event_count = 0
+        self._states = {}
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name="event writer", daemon=True)
+        self._thread.start()
+
+    def feed(self, sensor, samples):
+        state = self._states.get(sensor.port)
+        if state is None:
+            state = self._states[sensor.port] = _CaptureState(self.capacity)
+        threshold = self.thresholds.get(sensor.column, self.default_threshold)
+
+        while len(samples):
+            if state.event is None:
+                above = resultant(samples) >= threshold
+                rising = np.flatnonzero(above & ~np.concatenate(([state.was_above], above[:-1])))
+                if not len(rising):
+                    state.was_above = bool(above[-1])
+                    state.ring.extend(samples)
+                    return
+                i = rising[0]
+                trigger = samples['t'][i]
+                history = state.ring.window(self.capacity)
+                state.parts = [history[history['t'] >= trigger - self.pre], samples[:i]]
+                state.ring.extend(samples[:i])
+                state.event = {
+                    "id": self.event_count,
+                    "port": sensor.port,
+                    "column": sensor.column,
+                    "trigger_time": float(trigger),
+                    "trigger_wall_time": time.time() - (time.monotonic() - float(trigger)),
+                    "threshold": threshold,
+                    "path": None,
+                }
+                state.sensor = _SensorInfo(sensor.port, sensor.device, sensor.column)
+                self.event_count += 1
+                samples = samples[i:]
+                continue
+
+            end = np.searchsorted(samples['t'], state.event["trigger_time"] + self.post, side='right')
+            state.parts.append(samples[:end])
+            state.ring.extend(samples[:end])
+            if end == len(samples):
+                return  # window still open
+            self._finish(state)
+            samples = samples[end:]
+
+    def tick(self, now):
+        # Finish the windows of sensors that stopped sending; now is on the
+        # same clock as the samples' t
+        for state in self._states.values():
+            if state.event is not None and now >= state.event["trigger_time"] + self.post + self.grace:
+                self._finish(state)
+
+    def _finish(self, state):
+        window = np.concatenate(state.parts)
+        event = state.event
+        magnitude = resultant(window)
+        event["samples"] = len(window)
+        event["peak_g"] = float(magnitude.max()) if len(window) else 0.0
+        state.was_above = bool(magnitude[-1] >= event["threshold"]) if len(window) else False
+        state.event = None
+        state.parts = []
+        self.events.append(event)
+        self._queue.put((event, window, state.sensor))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            event, window, sensor = item
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(event["trigger_wall_time"]))
+            path = os.path.join(self.directory, f"event-{stamp}-{os.getpid()}-{event['id']}-port{event['port']}.rec")
+            records = np.empty(len(window), dtype=RECORD_DTYPE)
+            records['port'] = event['port']
+            for name in SAMPLE_FIELDS:
+                records[name] = window[name]
+            with open(path, 'wb') as file:
+                write_header(file, [sensor])
+                file.write(records.tobytes())
+            event["path"] = path
+
+    def recent_events(self, count=10):
+        return list(self.events)[-count:]
+
+    def close(self):
+        # Whatever open windows have so far is still worth keeping
+        for state in self._states.values():
+            if state.event is not None:
+                self._finish(state)
+        self._queue.put(None)
+        self._thread.join(timeout=5)
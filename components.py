@@ -1,17 +1,29 @@
 import pygame
 import math
+import os
+import time
+import numpy as np
 from grid3d import Grid3D
+from metrics import REGISTRY
 from oscilloscope import Oscilloscope
+from sensors_logic import NEUTRAL
+from spectrum import colorize
+from text_cache import get_font, render_text
 
 # --------------------- Components ---------------------
 
 class Component:
     def __init__(self, x, y, width, height):
         self.rect = pygame.Rect(x, y, width, height)
+        self._drawn_state = None
 
     def draw(self, surface):
         pass
 
+    def invalidate(self):
+        # Force the next draw of a static component, e.g. after a full-screen redraw
+        self._drawn_state = None
+
 class Grid3DComponent(Component):
     def __init__(self, x, y, width, height):
         super().__init__(x, y, width, height)
@@ -19,54 +31,96 @@ class Grid3DComponent(Component):
 
     def draw(self, surface, vector, offset=(0, 0)):
         self.grid.draw_3d_visualization(surface, vector, (self.rect.x + offset[0], self.rect.y + offset[1]))
+        return [self.rect.move(offset)]
 
 class OscilloscopeComponent(Component):
-    def __init__(self, x, y, width, height):
+    def __init__(self, x, y, width, height, samples_per_column=1):
         super().__init__(x, y, width, height)
-        self.oscilloscope = Oscilloscope(width, height)
+        self.oscilloscope = Oscilloscope(width, height, samples_per_column)
 
     def update(self, magnitude):
         self.oscilloscope.update(magnitude)
 
+    def extend(self, magnitudes):
+        self.oscilloscope.extend(magnitudes)
+
     def draw(self, surface, green_threshold, yellow_threshold):
+        surface.fill((0, 0, 0), self.rect)
         self.oscilloscope.draw(surface, green_threshold, yellow_threshold, (self.rect.x, self.rect.y))
+        return [self.rect]
+
+    def draw_history(self, surface, lo, hi, green_threshold, yellow_threshold):
+        surface.fill((0, 0, 0), self.rect)
+        self.oscilloscope.draw_history(surface, lo, hi, green_threshold, yellow_threshold, (self.rect.x, self.rect.y))
+        return [self.rect]
 
 class SensorViewComponent(Component):
+    # A column of available (neutral) sensors and one per group, each as
+    # long as it needs to be; the rows scroll together when they don't fit.
+    ROW_HEIGHT = 60
+    TOP = 70  # first row, below the column titles
+
     def __init__(self, x, y, width, height, logic_handler):
         super().__init__(x, y, width, height)
         self.logic_handler = logic_handler
+        self.columns = (NEUTRAL,) + tuple(logic_handler.groups)
+        self.scroll = 0
+
+    def _rows(self):
+        # sensor -> (column index, row) in list order within each column
+        rows = {}
+        counts = [0] * len(self.columns)
+        for sensor in self.logic_handler.sensor_manager.sensors:
+            column = self.columns.index(sensor.column) if sensor.column in self.columns else 0
+            rows[sensor] = (column, counts[column])
+            counts[column] += 1
+        return rows
+
+    def button_rect(self, sensor):
+        # Where the sensor's button is on screen, or None if it is scrolled out of view
+        column, row = self._rows().get(sensor, (0, 0))
+        rect = pygame.Rect(self.rect.x + column * self.column_width + 50, self.rect.y + self.TOP + row * self.ROW_HEIGHT - self.scroll, 100, 40)
+        return rect if rect.top >= self.rect.y + self.TOP - 10 and rect.bottom <= self.rect.bottom else None
+
+    def column_at(self, x):
+        # The group (or neutral) whose column x is in
+        return self.columns[min(max(0, (x - self.rect.x) // self.column_width), len(self.columns) - 1)]
+
+    @property
+    def column_width(self):
+        return self.rect.width // len(self.columns)
+
+    def scroll_by(self, pixels):
+        longest = max([row + 1 for _, row in self._rows().values()], default=0)
+        limit = max(0, self.TOP + longest * self.ROW_HEIGHT - self.rect.height)
+        self.scroll = min(max(self.scroll + pixels, 0), limit)
 
     def draw(self, surface):
-        column_width = self.rect.width // 3
-        row_height = 60
+        # Only redraws when a sensor changed or the list scrolled; returns the regions it touched
+        state = (self.scroll,) + tuple((sensor.port, sensor.device, sensor.connected, sensor.active, sensor.column) for sensor in self.logic_handler.sensor_manager.sensors)
+        if state == self._drawn_state:
+            return []
+        self._drawn_state = state
+        surface.fill((0, 0, 0), self.rect)
 
-        # Draw column headers
-        pygame.draw.line(surface, (255, 255, 255), (self.rect.x + column_width, self.rect.y), (self.rect.x + column_width, self.rect.y + self.rect.height))
-        pygame.draw.line(surface, (255, 255, 255), (self.rect.x + column_width * 2, self.rect.y), (self.rect.x + column_width * 2, self.rect.y + self.rect.height))
+        column_width = self.column_width
 
-        font = pygame.font.Font(None, 36)
-        neutral_title = font.render("Available Ports", True, (255, 255, 255))
-        ext_title = font.render("External", True, (255, 255, 255))
-        int_title = font.render("Internal", True, (255, 255, 255))
-        surface.blit(neutral_title, (self.rect.x + 50, self.rect.y + 20))
-        surface.blit(ext_title, (self.rect.x + column_width + 50, self.rect.y + 20))
-        surface.blit(int_title, (self.rect.x + column_width * 2 + 50, self.rect.y + 20))
+        # Draw column headers
+        for i, column in enumerate(self.columns):
+            if i:
+                pygame.draw.line(surface, (255, 255, 255), (self.rect.x + column_width * i, self.rect.y), (self.rect.x + column_width * i, self.rect.y + self.rect.height))
+            title = render_text("Available Ports" if column == NEUTRAL else column.capitalize(), (255, 255, 255))
+            surface.blit(title, (self.rect.x + column_width * i + 50, self.rect.y + 20))
 
         # Draw sensor buttons
         for sensor in self.logic_handler.sensor_manager.sensors:
-            self.draw_sensor_button(surface, sensor, column_width, row_height)
-
-    def draw_sensor_button(self, surface, sensor, column_width, row_height):
-        if sensor.column == "neutral":
-            x = self.rect.x + 50
-        elif sensor.column == "external":
-            x = self.rect.x + column_width + 50
-        elif sensor.column == "internal":
-            x = self.rect.x + column_width * 2 + 50
-        
-        y = self.rect.y + 70 + (sensor.port - 1) * row_height
-        
-        button_rect = pygame.Rect(x, y, 100, 40)
+            self.draw_sensor_button(surface, sensor)
+        return [self.rect]
+
+    def draw_sensor_button(self, surface, sensor):
+        button_rect = self.button_rect(sensor)
+        if button_rect is None:
+            return
         
         if sensor.connected:
             color = (0, 255, 0) if sensor.active else (0, 0, 255)
@@ -74,28 +128,305 @@ class SensorViewComponent(Component):
             color = (255, 0, 0)
         
         pygame.draw.rect(surface, color, button_rect)
-        font = pygame.font.Font(None, 36)
-        text = font.render(f"COM{sensor.port}", True, (255, 255, 255))
+        # COM3 on Windows, ttyACM0 and the like elsewhere
+        text = render_text(os.path.basename(sensor.device), (255, 255, 255), 24)
         surface.blit(text, (button_rect.x + 10, button_rect.y + 10))
 
+class SpectrumComponent(Component):
+    # A scrolling spectrogram strip per active sensor, low frequencies at the
+    # bottom and the newest column on the right. Each strip is a persistent
+    # surface: new columns are colorized in one NumPy pass, turned into a
+    # surface with surfarray and blitted on after a scroll, so a frame costs a
+    # few blits however many sensors there are. Strips start over when the
+    # set of active sensors changes.
+    def __init__(self, x, y, width, height, logic_handler, label_width=140):
+        super().__init__(x, y, width, height)
+        self.logic_handler = logic_handler
+        self.label_width = label_width
+        self._strips = {}  # sensor -> (surface, position)
+        self._nyquist = {}  # sensor -> top frequency on its label
+
+    def draw(self, surface, spectra):
+        # spectra: what LogicHandler.read_spectra() returned this frame
+        sensors = [sensor for sensor in self.logic_handler.sensor_manager.sensors if sensor.active and sensor.connected]
+        state = tuple((sensor.port, sensor.device) for sensor in sensors)
+        rects = []
+        if state != self._drawn_state:
+            self._drawn_state = state
+            self._layout(surface, sensors)
+            rects.append(self.rect)
+
+        for sensor in sensors:
+            if sensor not in spectra:
+                continue
+            strip, position = self._strips[sensor]
+            columns, rate = spectra[sensor]
+            columns = columns[-strip.get_width():]
+            height = strip.get_height()
+            rows = np.round(np.linspace(columns.shape[1] - 1, 0, height)).astype(int)
+            strip.scroll(-len(columns), 0)
+            strip.blit(pygame.surfarray.make_surface(colorize(columns, rows)), (strip.get_width() - len(columns), 0))
+            surface.blit(strip, position)
+            rects.append(pygame.Rect(position, strip.get_size()))
+
+            nyquist = round(rate / 2)
+            if self._nyquist.get(sensor) != nyquist:
+                self._nyquist[sensor] = nyquist
+                rects.append(self._draw_label(surface, sensor, position, height, f"0-{nyquist} Hz"))
+        return rects
+
+    def _layout(self, surface, sensors):
+        surface.fill((0, 0, 0), self.rect)
+        self._strips = {}
+        self._nyquist = {}
+        if not sensors:
+            text = render_text("No active sensors", (255, 255, 255))
+            surface.blit(text, (self.rect.x + 20, self.rect.y + 20))
+            return
+        pitch = self.rect.height // len(sensors)
+        width = self.rect.width - self.label_width - 10
+        for i, sensor in enumerate(sensors):
+            position = (self.rect.x + self.label_width, self.rect.y + i * pitch + 2)
+            strip = pygame.Surface((width, max(pitch - 4, 1)))
+            strip.fill((0, 0, 0))
+            self._strips[sensor] = (strip, position)
+            self._draw_label(surface, sensor, position, strip.get_height(), "")
+
+    def _draw_label(self, surface, sensor, position, height, frequencies):
+        area = pygame.Rect(self.rect.x, position[1], self.label_width, height)
+        surface.fill((0, 0, 0), area)
+        name = render_text(f"{sensor.port}: {os.path.basename(sensor.device)}", (255, 255, 255), 20)
+        surface.blit(name, (area.x + 6, area.y + 2))
+        if frequencies and height >= 40:
+            surface.blit(render_text(frequencies, (180, 180, 180), 20), (area.x + 6, area.y + 22))
+        return area
+
+class SensorTilesComponent(Component):
+    # Small multiples: a tile per active sensor with its latest x/y/z vector
+    # on a mini grid and its magnitude trace, in as square a grid as fits.
+    # Every tile lives in one atlas surface the size of the view: each frame
+    # the new samples of all sensors become magnitudes in one NumPy call, the
+    # vectors of the sensors that got data are projected in one go, each
+    # of those traces scrolls in place on its part of the atlas, and the
+    # changed tiles go to the screen in a single blits() call. Tiles start
+    # over when the set of active sensors changes.
+    LABEL_HEIGHT = 18
+    SAMPLES_PER_COLUMN = 4  # raw samples per trace column, ~2 s of a 1 kHz board on a 125 px tile
+
+    def __init__(self, x, y, width, height, logic_handler):
+        super().__init__(x, y, width, height)
+        self.logic_handler = logic_handler
+        self.atlas = pygame.Surface((width, height))
+        self._tiles = {}  # sensor -> (tile rect in the atlas, vector subsurface, Oscilloscope)
+        self._grid = None
+        self._blit_all = True
+
+    def invalidate(self):
+        # The atlas keeps every tile, so a full-screen redraw only needs it blitted again
+        self._blit_all = True
+
+    def _shape(self, count):
+        # (columns, rows) giving the biggest tiles, judged by their shorter side
+        best = None
+        for columns in range(1, count + 1):
+            rows = -(-count // columns)
+            side = min(self.rect.width // columns, self.rect.height // rows)
+            if best is None or side > best[0]:
+                best = (side, columns, rows)
+        return best[1:]
+
+    def draw(self, surface, batches, thresholds):
+        # batches: what LogicHandler.read_sensor_batches() returned this
+        # frame; thresholds: {group: (green, yellow)} for the traces
+        sensors = [sensor for sensor in self.logic_handler.sensor_manager.sensors if sensor.active and sensor.connected]
+        state = tuple((sensor.port, sensor.device, sensor.column) for sensor in sensors)
+        if state != self._drawn_state:
+            self._drawn_state = state
+            self._layout(sensors)
+            self._blit_all = True
+
+        fresh = [sensor for sensor in sensors if sensor in batches]
+        if fresh:
+            xyz = np.concatenate([np.column_stack((batches[s]['x'], batches[s]['y'], batches[s]['z'])) for s in fresh])
+            magnitudes = np.sqrt((xyz * xyz).sum(axis=1))
+            ends = np.cumsum([len(batches[sensor]) for sensor in fresh])
+            for sensor, part in zip(fresh, np.split(magnitudes, ends[:-1])):
+                self._tiles[sensor][2].extend(part)
+            vectors = [self._tiles[sensor][1] for sensor in fresh]
+            for vector in vectors:
+                vector.fill((0, 0, 0))
+            self._grid.draw_vectors(vectors, xyz[ends - 1], [(0, 0)] * len(fresh))
+
+        dirty = []
+        for sensor, (tile, vector, oscilloscope) in self._tiles.items():
+            changed = oscilloscope.render(*thresholds.get(sensor.column, (1.0, 2.0)))
+            if changed or sensor in batches:
+                dirty.append(tile)
+
+        if self._blit_all:
+            self._blit_all = False
+            surface.blit(self.atlas, self.rect)
+            return [self.rect]
+        surface.blits([(self.atlas, tile.move(self.rect.topleft), tile) for tile in dirty], False)
+        return [tile.move(self.rect.topleft) for tile in dirty]
+
+    def _layout(self, sensors):
+        self.atlas.fill((0, 0, 0))
+        self._tiles = {}
+        if not sensors:
+            text = render_text("No active sensors", (255, 255, 255))
+            self.atlas.blit(text, (20, 20))
+            return
+        columns, rows = self._shape(len(sensors))
+        width = self.rect.width // columns
+        height = self.rect.height // rows
+        # Inside the border and below the label; the vector sits left of the
+        # trace on wide tiles and above it on narrow ones
+        body = pygame.Rect(1, self.LABEL_HEIGHT, width - 6, height - self.LABEL_HEIGHT - 5)
+        if body.width >= 2 * body.height:
+            vector_area = pygame.Rect(body.x, body.y, body.height, body.height)
+            trace_area = pygame.Rect(vector_area.right, body.y, body.width - body.height, body.height)
+        else:
+            vector_area = pygame.Rect(body.x, body.y, body.width, body.height // 2)
+            trace_area = pygame.Rect(body.x, vector_area.bottom, body.width, body.height - vector_area.height)
+        # All tiles share one grid, which is what lets draw_vectors batch them
+        self._grid = Grid3D(vector_area.width, vector_area.height, max(min(vector_area.size) // 4, 4), 14)
+
+        vectors = []
+        for i, sensor in enumerate(sensors):
+            tile = pygame.Rect(i % columns * width, i // columns * height, width - 4, height - 4)
+            pygame.draw.rect(self.atlas, (60, 60, 60), tile, 1)
+            group = "" if sensor.column == NEUTRAL else f"  {sensor.column}"
+            label = render_text(f"{sensor.port}: {os.path.basename(sensor.device)}{group}", (255, 255, 255), 18)
+            self.atlas.blit(label, (tile.x + 4, tile.y + 2), (0, 0, tile.width - 6, self.LABEL_HEIGHT - 2))
+            vector = self.atlas.subsurface(vector_area.move(tile.topleft))
+            trace = self.atlas.subsurface(trace_area.move(tile.topleft))
+            self._tiles[sensor] = (tile, vector, Oscilloscope(trace_area.width, trace_area.height, self.SAMPLES_PER_COLUMN, trace))
+            vectors.append(vector)
+        # Axes only until the first samples come in
+        self._grid.draw_vectors(vectors, np.zeros((len(vectors), 3)), [(0, 0)] * len(vectors))
+
+class MetricsOverlayComponent(Component):
+    # Frame timing and per-port ingest rates from the metrics registry. The
+    # text is only re-rendered every `refresh` seconds, with rates and
+    # averages taken over that window; other frames just blit it again.
+    def __init__(self, x, y, width, height, refresh=0.5):
+        super().__init__(x, y, width, height)
+        self.refresh = refresh
+        self._surface = pygame.Surface((width, height))
+        self._next_refresh = 0
+        self._previous = {}
+        self._previous_time = None
+
+    def _delta(self, name, key, value):
+        # Change of a counter since the last refresh
+        previous = self._previous.get((name, key), value)
+        self._previous[(name, key)] = value
+        return value - previous
+
+    def _render(self, view):
+        now = time.monotonic()
+        elapsed = now - self._previous_time if self._previous_time else None
+        self._previous_time = now
+        REGISTRY.collect()
+
+        lines = []
+        frames = {dict(key)["phase"]: metric for key, metric in REGISTRY.family("macparkman_frame_seconds").items() if dict(key)["view"] == view}
+        if "draw" in frames:
+            count = self._delta("frames", view, frames["draw"].count)
+            fps = f"{count / elapsed:.0f} fps" if elapsed else ""
+            lines.append(f"{view}  {fps}")
+            phases = []
+            for phase in ("read", "draw", "flip"):
+                if phase in frames:
+                    total = self._delta("frame_seconds", (view, phase), frames[phase].sum)
+                    phases.append(f"{phase} {total / count * 1000:.2f}" if count else f"{phase} -")
+            lines.append("  ".join(phases) + " ms")
+
+        lines_read = REGISTRY.family("macparkman_lines_total")
+        errors = REGISTRY.family("macparkman_parse_errors_total")
+        read_bytes = REGISTRY.family("macparkman_bytes_read_total")
+        connected = REGISTRY.family("macparkman_connected")
+        backlog = {dict(key)["port"]: metric.value for key, metric in REGISTRY.family("macparkman_ring_backlog").items() if dict(key)["consumer"] == "logic"}
+        dropped = {}
+        for key, metric in REGISTRY.family("macparkman_dropped_samples_total").items():
+            port = dict(key)["port"]
+            dropped[port] = dropped.get(port, 0) + metric.value
+        for key, metric in sorted(connected.items()):
+            port = dict(key)["port"]
+            rate = self._delta("lines", key, lines_read[key].value) / elapsed if elapsed and key in lines_read else 0
+            kilobytes = self._delta("bytes", key, read_bytes[key].value) / elapsed / 1000 if elapsed and key in read_bytes else 0
+            state = "" if metric.value else "  DOWN"
+            lines.append(f"port {port}: {rate:.0f} lines/s {kilobytes:.1f} kB/s  err {errors[key].value if key in errors else 0}"
+                         f"  backlog {backlog.get(port, 0)}  drop {dropped.get(port, 0)}{state}")
+
+        self._surface.fill((20, 20, 20))
+        font = get_font(20)
+        for i, line in enumerate(lines[:self.rect.height // 18]):
+            self._surface.blit(font.render(line, True, (200, 200, 200)), (6, 4 + i * 18))
+
+    def draw(self, surface, view):
+        now = time.monotonic()
+        if now >= self._next_refresh:
+            self._next_refresh = now + self.refresh
+            self._render(view)
+        surface.blit(self._surface, self.rect)
+        return [self.rect]
+
+class StatusComponent(Component):
+    # A one-line message over the bottom of the view for a few seconds, e.g.
+    # what auto-zero did. The view underneath redraws every frame, so it is
+    # drawn again every frame while it shows.
+    def __init__(self, x, y, width, height):
+        super().__init__(x, y, width, height)
+        self.text = None
+        self.until = 0
+
+    def show(self, text, seconds=4.0):
+        self.text = text
+        self.until = time.monotonic() + seconds
+
+    @property
+    def visible(self):
+        return self.text is not None and time.monotonic() < self.until
+
+    def draw(self, surface):
+        if not self.visible:
+            return []
+        surface.fill((20, 20, 20), self.rect)
+        text = render_text(self.text, (255, 255, 255), 24)
+        surface.blit(text, (self.rect.x + 8, self.rect.y + (self.rect.height - text.get_height()) // 2), (0, 0, self.rect.width - 16, self.rect.height))
+        return [self.rect]
+
 class MenuComponent(Component):
     def __init__(self, x, y, width, height, buttons):
         super().__init__(x, y, width, height)
         self.buttons = buttons
 
+    @property
+    def pitch(self):
+        # 200 px buttons 10 px apart, narrower when that doesn't fit
+        return min(210, (self.rect.width - 10) // max(len(self.buttons), 1))
+
     def draw(self, surface):
+        # The menu never changes, so after the first draw this is free
+        if self._drawn_state:
+            return []
+        self._drawn_state = True
         pygame.draw.rect(surface, (50, 50, 50), self.rect)
         
+        pitch = self.pitch
         for i, (text, _) in enumerate(self.buttons):
-            button_rect = pygame.Rect(self.rect.x + 10 + i * 210, self.rect.y + 5, 200, 40)
+            button_rect = pygame.Rect(self.rect.x + 10 + i * pitch, self.rect.y + 5, pitch - 10, 40)
             pygame.draw.rect(surface, (100, 100, 100), button_rect)
-            font = pygame.font.Font(None, 36)
-            text_surface = font.render(text, True, (255, 255, 255))
+            text_surface = render_text(text, (255, 255, 255))
             surface.blit(text_surface, (button_rect.x + 10, button_rect.y + 10))
+        return [self.rect]
 
     def handle_click(self, pos):
+        pitch = self.pitch
         for i, (_, action) in enumerate(self.buttons):
-            if self.rect.x + 10 + i * 210 <= pos[0] <= self.rect.x + 210 + i * 210 and self.rect.y <= pos[1] <= self.rect.y + self.rect.height:
+            if self.rect.x + 10 + i * pitch <= pos[0] <= self.rect.x + pitch + i * pitch and self.rect.y <= pos[1] <= self.rect.y + self.rect.height:
                 action()
                 return True
         return False
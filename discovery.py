@@ -0,0 +1,154 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import serial
+from serial.tools import list_ports
+from transports import SerialTransport
+
+PROBE_TIMEOUT = 2.0  # s to wait for a board's first complete line
+SCAN_INTERVAL = 2.0  # s between looks for newly plugged-in ports
+RETRY_DELAY = 0.5  # s before the first reconnect attempt, doubled after every failure
+MAX_RETRY_DELAY = 30.0
+
+# An OpenLog Artemis line starts "rtcDate,rtcTime,aX,aY,aZ", e.g.
+# "01/02/2024,12:34:56.78,0.01,-0.02,1.00,...", or the column header itself
+ARTEMIS_LINE = re.compile(rb"^\s*(\d\d/\d\d/\d{4},\d\d:\d\d:\d\d(\.\d+)?(,\s*[-+]?[\d.]+([eE][-+]?\d+)?){3}|rtcDate,rtcTime,aX,aY,aZ)", re.MULTILINE)
+
+def serial_numbers():
+    # {device: USB serial number or None} for every serial port the OS knows
+    # about: COMn on Windows, /dev/ttyACM* and /dev/ttyUSB* (and friends) on
+    # Linux, /dev/cu.* on macOS
+    return {port.device: port.serial_number for port in list_ports.comports()}
+
+def candidate_ports():
+    return sorted(serial_numbers())
+
+def probe(device, baud_rate=115200, timeout=PROBE_TIMEOUT, serial_number=None):
+    # Open `device` and listen for up to `timeout` seconds. Returns the still
+    # open SerialTransport if the board talks like an Artemis, else None.
+    transport = SerialTransport(device, baud_rate, serial_number)
+    try:
+        transport.open()
+        transport.ser.timeout = 0.1
+        data = b""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            data = (data + transport.read())[-65536:]
+            if ARTEMIS_LINE.search(data):
+                transport.ser.timeout = 1
+                return transport
+    except (serial.SerialException, OSError):
+        pass
+    transport.close()
+    return None
+
+def discover(devices=None, baud_rate=115200, timeout=PROBE_TIMEOUT):
+    # Probes every candidate port at once, so a full rack takes as long as
+    # the slowest single probe. Returns the open transports of the boards
+    # found, in port order.
+    numbers = serial_numbers()
+    devices = sorted(numbers) if devices is None else devices
+    if not devices:
+        return []
+    with ThreadPoolExecutor(max_workers=len(devices), thread_name_prefix="probe") as pool:
+        found = pool.map(lambda device: probe(device, baud_rate, timeout, numbers.get(device)), devices)
+        return [transport for transport in found if transport]
+
+class PortSupervisor:
+    # Keeps a SensorManager's ports alive in the background: sensors whose
+    # transport can be reopened get reconnected with exponential backoff after
+    # they drop out, and (when scanning) newly plugged-in boards are probed
+    # and added. A board that comes back under another device name is known
+    # by its USB serial number and handed back to its old sensor instead of
+    # becoming a new one. All opening and probing happens on a worker pool, so neither
+    # the UI nor the other ports ever wait on a slow device.
+    def __init__(self, manager, scan=False, interval=0.25):
+        self.manager = manager
+        self.scan = scan
+        self.interval = interval
+        self.reconnects = 0
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="reconnect")
+        self._pending = {}  # sensor port or device name -> Future
+        self._retry = {}  # sensor port -> (next attempt time, delay)
+        self._known = set()  # devices already probed, so a non-Artemis port is only probed once per plug
+        self._next_scan = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._known = {sensor.device for sensor in self.manager.sensors}
+        self._thread = threading.Thread(target=self._run, name="port supervisor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for key, future in list(self._pending.items()):
+                if future.done():
+                    del self._pending[key]
+            for sensor in list(self.manager.sensors):
+                if sensor.connected or not sensor.transport or not sensor.transport.reconnectable:
+                    self._retry.pop(sensor.port, None)
+                elif sensor.port not in self._pending:
+                    self._reconnect_when_due(sensor, now)
+            if self.scan and now >= self._next_scan:
+                self._next_scan = now + SCAN_INTERVAL
+                self._scan()
+            self._stop.wait(self.interval)
+
+    def _reconnect_when_due(self, sensor, now):
+        due, delay = self._retry.get(sensor.port, (now + RETRY_DELAY, RETRY_DELAY))
+        if now < due:
+            self._retry.setdefault(sensor.port, (due, delay))
+            return
+        delay = min(delay * 2, MAX_RETRY_DELAY)
+        self._retry[sensor.port] = (now + delay, delay)
+        self._pending[sensor.port] = self._pool.submit(self._reconnect, sensor)
+
+    def _reconnect(self, sensor, transport=None):
+        if self.manager.reconnect(sensor, transport):
+            self.reconnects += 1
+
+    def _unplugged(self, serial_number):
+        # The dropped-out sensor whose board has this serial number, if any
+        if serial_number is None:
+            return None
+        for sensor in self.manager.sensors:
+            if not sensor.connected and sensor.transport and sensor.transport.serial_number == serial_number:
+                return sensor
+        return None
+
+    def _scan(self):
+        try:
+            present = serial_numbers()
+        except OSError:
+            return
+        # Forget unplugged ports so they get probed again when they come back
+        self._known &= set(present) | {sensor.device for sensor in self.manager.sensors}
+        for device in sorted(set(present) - self._known):
+            sensor = self._unplugged(present[device])
+            if sensor and sensor.port in self._pending:
+                continue  # its reconnect attempt is still running; look again next scan
+            self._known.add(device)
+            if sensor:
+                self._pending[sensor.port] = self._pool.submit(self._replug, sensor, device)
+            else:
+                self._pending[device] = self._pool.submit(self._probe, device, present[device])
+
+    def _probe(self, device, serial_number):
+        transport = probe(device, serial_number=serial_number)
+        if transport:
+            self.manager.add_sensor(transport)
+
+    def _replug(self, sensor, device):
+        transport = probe(device, serial_number=sensor.transport.serial_number)
+        if transport:
+            self._reconnect(sensor, transport)
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self._pool.shutdown(wait=True, cancel_futures=True)
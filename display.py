@@ -1,11 +1,35 @@
+import os
 import pygame
 import sys
+import threading
+import time
 from sensors_logic import LogicHandler
-from components import Grid3DComponent, OscilloscopeComponent, SensorViewComponent, MenuComponent
+from fusion import FUSION_RATE
+from metrics import REGISTRY
+from components import Grid3DComponent, OscilloscopeComponent, SensorViewComponent, SpectrumComponent, SensorTilesComponent, MenuComponent, MetricsOverlayComponent, StatusComponent
+from text_cache import get_font, render_text
+
+DATA_EVENT = pygame.USEREVENT  # posted by the waker thread when new samples arrive
+DATA_VIEWS = ("grid", "oscilloscope", "spectrum", "boards")  # views that draw samples
+IDLE_REDRAW = 1.0  # s between redraws with no input and no data, for connection changes
+
+def refresh_rate():
+    # The monitor's refresh rate where SDL knows it, otherwise 60
+    try:
+        rates = pygame.display.get_desktop_refresh_rates()
+    except (AttributeError, pygame.error):
+        rates = []
+    return rates[0] if rates and rates[0] > 0 else 60
 
 class Game:
-    def __init__(self):
+    # With dirty_rects on, each view reports the regions it changed and only
+    # those are pushed to the display; switching views still redraws everything.
+    # headless renders through SDL's dummy video driver with no window, and
+    # logic replaces the LogicHandler, e.g. one fed by synthetic transports.
+    def __init__(self, dirty_rects=True, headless=False, logic=None):
         # Initialize Pygame and set up the display
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
         pygame.init()
         self.width, self.height = 1000, 750
         self.screen = pygame.display.set_mode((self.width, self.height))
@@ -13,45 +37,90 @@ class Game:
 
         # Set up the clock and font
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 36)
+        self.refresh_rate = refresh_rate()
+        self.font = get_font(36)
 
         # Initialize logic handler
-        self.logic = LogicHandler()
+        self.logic = logic or LogicHandler()
         
-        # Create components
-        self.grid_external = Grid3DComponent(0, 0, self.width // 2 - 50, self.height - 100)
-        self.grid_internal = Grid3DComponent(self.width // 2, 0, self.width // 2 - 50, self.height - 100)
-
-        self.oscilloscope_external = OscilloscopeComponent(0, 0, self.width - 200, (self.height - 150) // 2)
-        self.oscilloscope_internal = OscilloscopeComponent(0, (self.height) // 2, self.width - 200, (self.height - 150) // 2)
+        # Create components: one grid (side by side) and one oscilloscope
+        # panel (stacked) per sensor group
+        self.groups = self.logic.groups
+        grid_width = self.width // len(self.groups)
+        self.grids = [Grid3DComponent(i * grid_width, 0, grid_width - 50, self.height - 100) for i in range(len(self.groups))]
+
+        # The traces get every fused tick, so about 60 columns a second still scroll like before
+        samples_per_column = FUSION_RATE // 60
+        self.panel_height = (self.height - 50) // len(self.groups)
+        self.oscilloscopes = [
+            OscilloscopeComponent(0, i * self.panel_height, self.width - 200, self.panel_height - 50, samples_per_column)
+            for i in range(len(self.groups))
+        ]
 
         self.sensor_view = SensorViewComponent(0, 0, self.width, self.height - 50, self.logic)
+        self.spectrum_view = SpectrumComponent(0, 0, self.width, self.height - 50, self.logic)
+        self.tiles_view = SensorTilesComponent(0, 0, self.width, self.height - 50, self.logic)
         
         self.menu = MenuComponent(0, self.height - 50, self.width, 50, [
             ("Grid", lambda: setattr(self, 'view_mode', 'grid')),
             ("Oscilloscope", lambda: setattr(self, 'view_mode', 'oscilloscope')),
-            ("Sensors", lambda: setattr(self, 'view_mode', 'sensors'))
+            ("Sensors", lambda: setattr(self, 'view_mode', 'sensors')),
+            ("Spectrum", lambda: setattr(self, 'view_mode', 'spectrum')),
+            ("Boards", lambda: setattr(self, 'view_mode', 'boards'))
         ])
 
-        # Set initial view mode and thresholds
+        # Set initial view mode and [green, yellow] thresholds per group
         self.view_mode = "grid"
-        self.green_threshold_external = 1.0
-        self.yellow_threshold_external = 2.0
-        self.green_threshold_internal = 1.0
-        self.yellow_threshold_internal = 2.0
+        self.thresholds = {group: list(self.logic.thresholds[group]) for group in self.groups}
         self.max_threshold_value = 10  # Max value for sliders
 
         self.dragging_port = None
 
+        # Session time the scrolled-back oscilloscopes end at, None when live
+        # (mouse wheel or left/right arrows, End to go live again); the
+        # history comes from the LogicHandler's pyramid index
+        self.history_end = None
+        self.history_window = (self.width - 200) * samples_per_column / FUSION_RATE
+
+        # F3 toggles frame timing and ingest counters in the bottom-left corner
+        self.metrics_overlay = MetricsOverlayComponent(0, self.height - 50 - 170, 520, 170)
+        self.show_metrics = False
+
+        # Short-lived messages such as the result of auto-zero, above the menu
+        self.status = StatusComponent(self.width - 520, self.height - 50 - 32, 520, 32)
+        self._read_time = 0.0
+        self._frame_metrics = {}
+
+        self.dirty_rects = dirty_rects
+        self._drawn_view = None
+        self._drawn_sliders = {}
+
+        # The waker thread turns new samples into DATA_EVENTs, keeping at most one queued
+        self._data_pending = threading.Event()
+        self._stop = threading.Event()
+        self._last_frame = 0.0
+
     def run(self):
+        # Event driven: the loop sleeps until there is input, new samples or
+        # IDLE_REDRAW has passed, and only views that draw samples are redrawn
+        # for new ones, at most at the monitor's refresh rate. Quiet sensors
+        # and no input leave it asleep.
         # Connect to sensors
         self.logic.connect_to_sensors()
+        self._stop.clear()
+        waker = threading.Thread(target=self._wake_on_data, name="display waker", daemon=True)
+        waker.start()
 
         running = True
         while running:
+            events = [pygame.event.wait(self.idle_timeout())] + pygame.event.get()
+            fresh = False
             # Event handling
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+            for event in events:
+                if event.type == DATA_EVENT:
+                    self._data_pending.clear()
+                    fresh = True
+                elif event.type == pygame.QUIT:
                     running = False
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     self.handle_click(event.pos)
@@ -60,85 +129,245 @@ class Game:
                 elif event.type == pygame.MOUSEMOTION:
                     if event.buttons[0]:  # Left mouse button
                         self.handle_drag(event.pos)
-
-            # Clear the screen
-            self.screen.fill((0, 0, 0))
-
-            # Draw the current view
-            if self.view_mode == "grid":
-                self.draw_grid_view()
-            elif self.view_mode == "oscilloscope":
-                self.draw_oscilloscope_view()
-            elif self.view_mode == "sensors":
-                self.draw_sensor_view()
-
-            # Draw bottom menu
-            self.menu.draw(self.screen)
-
-            # Update the display
-            pygame.display.flip()
-            self.clock.tick(60)  # 60 FPS
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.show_metrics = not self.show_metrics
+                    self._drawn_view = None  # repaint whatever the overlay covered
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_z:
+                    self.auto_zero()
+                elif event.type == pygame.MOUSEWHEEL and self.view_mode == "oscilloscope":
+                    self.scroll_history(event.y * self.history_window / 4)
+                elif event.type == pygame.MOUSEWHEEL and self.view_mode == "sensors":
+                    self.sensor_view.scroll_by(-event.y * 60)
+                elif event.type == pygame.KEYDOWN and self.view_mode == "oscilloscope":
+                    self.handle_history_key(event.key)
+
+            if (fresh or events[0].type == pygame.NOEVENT) and self.view_mode not in DATA_VIEWS:
+                # Nothing on screen reads the samples, but impacts, event
+                # captures and the history still need them, and the idle
+                # wake-up finishes captures of sensors that went quiet
+                self.logic.process_samples()
+            # Anything but a DATA_EVENT is input or the idle wake-up (NOEVENT);
+            # a view that ignores the data still redraws every IDLE_REDRAW
+            # for sensors connecting and dropping out
+            if ((fresh and self.view_mode in DATA_VIEWS) or any(event.type != DATA_EVENT for event in events)
+                    or time.monotonic() - self._last_frame >= IDLE_REDRAW):
+                self.draw_frame()
+                self._last_frame = time.monotonic()
+                self.clock.tick(self.refresh_rate)
 
         # Clean up
+        self._stop.set()
+        waker.join(timeout=2)
         self.logic.close_sensors()
         pygame.quit()
         sys.exit()
 
+    def idle_timeout(self):
+        # ms run() sleeps at most with no input and no data; the metrics overlay wants refreshing more often
+        return int(1000 * (self.metrics_overlay.refresh if self.show_metrics else IDLE_REDRAW))
+
+    def _wake_on_data(self):
+        # New samples become a DATA_EVENT, at most one per refresh and never
+        # more than one waiting in the queue
+        pacer = self.logic.pacer(1 / self.refresh_rate)
+        while not self._stop.is_set():
+            if pacer.wait(self._stop) and not self._data_pending.is_set():
+                self._data_pending.set()
+                pygame.event.post(pygame.event.Event(DATA_EVENT))
+
+    def auto_zero(self):
+        # Z zeroes every still sensor on its last second of samples
+        zeroed, moving = self.logic.auto_zero()
+        text = f"Zeroed {', '.join(str(sensor.port) for sensor in zeroed) or 'nothing'}"
+        if moving:
+            text += f", still moving: {', '.join(str(sensor.port) for sensor in moving)}"
+        self.status.show(text)
+
+    def draw_frame(self):
+        # One frame, timed as read (sensor data), draw and flip per view;
+        # returns those three times in seconds
+        started = time.perf_counter()
+        self._read_time = 0.0
+        view = self.view_mode
+        if self.status.text and not self.status.visible:
+            # Repaint whatever the message covered
+            self.status.text = None
+            self._drawn_view = None
+        if self.dirty_rects and view == self._drawn_view:
+            # Push only what changed since the last frame
+            rects = self.draw_view()
+            rects += self.menu.draw(self.screen)
+            if self.show_metrics:
+                rects += self.metrics_overlay.draw(self.screen, view)
+            rects += self.status.draw(self.screen)
+            drawn = time.perf_counter()
+            if rects:
+                pygame.display.update(rects)
+        else:
+            # Clear the screen and redraw everything
+            self.invalidate()
+            self.screen.fill((0, 0, 0))
+            self.draw_view()
+            self.menu.draw(self.screen)
+            if self.show_metrics:
+                self.metrics_overlay.draw(self.screen, view)
+            self.status.draw(self.screen)
+            drawn = time.perf_counter()
+            pygame.display.flip()
+            self._drawn_view = view
+        flipped = time.perf_counter()
+
+        histograms = self._frame_metrics.get(view)
+        if histograms is None:
+            histograms = self._frame_metrics[view] = [
+                REGISTRY.histogram("macparkman_frame_seconds", "Frame time by view and phase", view=view, phase=phase)
+                for phase in ("read", "draw", "flip")
+            ]
+        phases = (self._read_time, drawn - started - self._read_time, flipped - drawn)
+        for histogram, seconds in zip(histograms, phases):
+            histogram.observe(seconds)
+        return phases
+
+    def read(self, fetch):
+        # Sensor data for this frame, with the time it took counted as "read"
+        started = time.perf_counter()
+        result = fetch()
+        self._read_time += time.perf_counter() - started
+        return result
+
+    def draw_view(self):
+        # Draw the current view and return the regions that changed
+        if self.view_mode == "grid":
+            return self.draw_grid_view()
+        elif self.view_mode == "oscilloscope":
+            return self.draw_oscilloscope_view()
+        elif self.view_mode == "sensors":
+            return self.draw_sensor_view()
+        elif self.view_mode == "spectrum":
+            return self.draw_spectrum_view()
+        elif self.view_mode == "boards":
+            return self.draw_boards_view()
+        return []
+
+    def invalidate(self):
+        # Make every cached part of the screen draw again on the next frame
+        self.sensor_view.invalidate()
+        self.spectrum_view.invalidate()
+        self.tiles_view.invalidate()
+        self.menu.invalidate()
+        self._drawn_sliders = {}
+
     def draw_grid_view(self):
-        # Draw the grid view with external and internal XYZ data
-        external_xyz, internal_xyz = self.logic.read_xyz_data()
+        # Draw the grid view with every group's XYZ data
+        latest = self.read(self.logic.read_xyz_data)
+
+        # The vectors and readouts move every frame, so redo everything above the menu
+        area = pygame.Rect(0, 0, self.width, self.height - 50)
+        self.screen.fill((0, 0, 0), area)
         
-        if external_xyz:
-            self.grid_external.draw(self.screen, external_xyz)
-            magnitude = self.logic.calculate_magnitude(external_xyz)
-            text = self.font.render(f"External - X: {external_xyz[0]:.2f}, Y: {external_xyz[1]:.2f}, Z: {external_xyz[2]:.2f}", True, (255, 255, 255))
-            magnitude_text = self.font.render(f"Magnitude: {magnitude:.2f}", True, (255, 255, 255))
-            self.screen.blit(text, (10, 50))
-            self.screen.blit(magnitude_text, (10, 90))
-
-        if internal_xyz:
-            self.grid_internal.draw(self.screen, internal_xyz)
-            magnitude = self.logic.calculate_magnitude(internal_xyz)
-            text = self.font.render(f"Internal - X: {internal_xyz[0]:.2f}, Y: {internal_xyz[1]:.2f}, Z: {internal_xyz[2]:.2f}", True, (255, 255, 255))
-            magnitude_text = self.font.render(f"Magnitude: {magnitude:.2f}", True, (255, 255, 255))
-            self.screen.blit(text, (self.width // 2 + 10, 50))
-            self.screen.blit(magnitude_text, (self.width // 2 + 10, 90))
+        # Smaller readouts once more than two groups share the width
+        size = 36 if len(self.groups) <= 2 else 24
+        for group, grid, xyz in zip(self.groups, self.grids, latest):
+            grid.draw(self.screen, xyz)
+            magnitude = self.logic.calculate_magnitude(xyz)
+            text = render_text(f"{group.capitalize()} - X: {xyz[0]:.2f}, Y: {xyz[1]:.2f}, Z: {xyz[2]:.2f}", (255, 255, 255), size)
+            magnitude_text = render_text(f"Magnitude: {magnitude:.2f}", (255, 255, 255), size)
+            self.screen.blit(text, (grid.rect.x + 10, 50))
+            self.screen.blit(magnitude_text, (grid.rect.x + 10, 90))
+
+        return [area]
 
     def draw_oscilloscope_view(self):
-        # Draw the oscilloscope view with external and internal XYZ data
-        external_xyz, internal_xyz = self.logic.read_xyz_data()
+        # Draw one oscilloscope per group
+        # Impacts and captured events are whatever goes past the yellow threshold
+        self.logic.set_thresholds({group: yellow for group, (green, yellow) in self.thresholds.items()})
+        batches = self.read(self.logic.read_xyz_batches)
+        rects = []
         
-        if external_xyz:
-            magnitude = self.logic.calculate_magnitude(external_xyz)
-            self.oscilloscope_external.update(magnitude)
-            self.oscilloscope_external.draw(self.screen, self.green_threshold_external, self.yellow_threshold_external)
-
-        if internal_xyz:
-            magnitude = self.logic.calculate_magnitude(internal_xyz)
-            self.oscilloscope_internal.update(magnitude)
-            self.oscilloscope_internal.draw(self.screen, self.green_threshold_internal, self.yellow_threshold_internal)
-
-        # Draw threshold sliders
-        self.draw_threshold_slider(self.green_threshold_external, self.yellow_threshold_external, 0)
-        self.draw_threshold_slider(self.green_threshold_internal, self.yellow_threshold_internal, self.height // 2)
-
-        # Labels
-        external_label = self.font.render("External Sensor Oscilloscope", True, (255, 255, 255))
-        internal_label = self.font.render("Internal Sensor Oscilloscope", True, (255, 255, 255))
-        self.screen.blit(external_label, (10, 10))
-        self.screen.blit(internal_label, (10, self.height // 2 + 10))
+        # The live traces keep filling while scrolled back, so going live is instant
+        for oscilloscope, batch in zip(self.oscilloscopes, batches):
+            oscilloscope.extend(self.logic.calculate_magnitudes(batch))
+        if self.history_end is not None:
+            rects += self.draw_history()
+        else:
+            for group, oscilloscope in zip(self.groups, self.oscilloscopes):
+                rects += oscilloscope.draw(self.screen, *self.thresholds[group])
+
+        for i, group in enumerate(self.groups):
+            top = i * self.panel_height
+            # Draw threshold sliders
+            rects += self.draw_threshold_slider(*self.thresholds[group], top)
+
+            # Labels
+            label = render_text(f"{group.capitalize()} Sensor Oscilloscope", (255, 255, 255))
+            self.screen.blit(label, (10, top + 10))
+
+            # Metrics of the latest impact in the group
+            impact = self.logic.impact_monitor.latest(group)
+            if impact:
+                text = render_text(f"Last impact: {impact['peak_g']:.1f} g peak, HIC15 {impact['hic15']:.0f}, HIC36 {impact['hic36']:.0f}", (255, 255, 255), 24)
+                self.screen.blit(text, (10, top + 40))
+        return rects
+
+    def draw_history(self):
+        # Every trace as it was up to history_end, read from the pyramid at
+        # one point per pixel column however far back that is
+        end = self.history_end
+        width = self.oscilloscopes[0].rect.width
+        result = self.read(lambda: self.logic.history.query(end - self.history_window, end, width))
+        rects = []
+        for group, oscilloscope in zip(self.groups, self.oscilloscopes):
+            i = result["channels"].index(group)
+            rects += oscilloscope.draw_history(self.screen, result["min"][:, i], result["max"][:, i], *self.thresholds[group])
+        label = render_text(f"History: {self.logic.history.duration - end:.1f} s ago (End for live)", (255, 255, 255), 24)
+        self.screen.blit(label, (self.width - 200 - label.get_width() - 10, 10))
+        return rects
+
+    def scroll_history(self, seconds):
+        # Positive seconds scroll further back, never past the session start;
+        # scrolling forward past the live edge goes live again
+        duration = self.logic.history.duration
+        end = (duration if self.history_end is None else self.history_end) - seconds
+        self.history_end = max(end, min(self.history_window, duration)) if end < duration else None
+
+    def handle_history_key(self, key):
+        if key == pygame.K_LEFT:
+            self.scroll_history(self.history_window / 4)
+        elif key == pygame.K_RIGHT:
+            self.scroll_history(-self.history_window / 4)
+        elif key == pygame.K_END:
+            self.history_end = None
 
     def draw_sensor_view(self):
         # Draw the sensor view
-        self.sensor_view.draw(self.screen)
+        return self.sensor_view.draw(self.screen)
+
+    def draw_spectrum_view(self):
+        # Draw the spectrogram of every active sensor
+        spectra = self.read(self.logic.read_spectra)
+        return self.spectrum_view.draw(self.screen, spectra)
+
+    def draw_boards_view(self):
+        # Draw a tile per active sensor, traces colored by its group's thresholds
+        batches = self.read(self.logic.read_sensor_batches)
+        return self.tiles_view.draw(self.screen, batches, self.thresholds)
 
     def draw_threshold_slider(self, green_threshold, yellow_threshold, y_offset):
-        # Draw the threshold slider for the oscilloscope view
+        # Draw the threshold slider for the oscilloscope view, only when it moved
+        if self._drawn_sliders.get(y_offset) == (green_threshold, yellow_threshold):
+            return []
+        self._drawn_sliders[y_offset] = (green_threshold, yellow_threshold)
+
         slider_width = 40
-        slider_height = self.height // 2 - 100
+        slider_height = self.panel_height - 75
         x = self.width - 70
         y = 50 + y_offset
 
+        # Everything right of the oscilloscope around the slider, kept off the menu bar
+        area = pygame.Rect(x - 105, y - 20, self.width - x + 105, slider_height + 40).clip(0, 0, self.width, self.height - 50)
+        self.screen.fill((0, 0, 0), area)
+        self.screen.set_clip(area)
+
         pygame.draw.rect(self.screen, (100, 100, 100), (x, y, slider_width, slider_height))
 
         green_pos = int(y + (1 - green_threshold / self.max_threshold_value) * slider_height)
@@ -147,10 +376,12 @@ class Game:
         pygame.draw.rect(self.screen, (0, 255, 0), (x - 5, green_pos - 5, slider_width + 10, 10))
         pygame.draw.rect(self.screen, (255, 255, 0), (x - 5, yellow_pos - 5, slider_width + 10, 10))
 
-        green_text = self.font.render(f"G: {green_threshold:.2f}", True, (255, 255, 255))
-        yellow_text = self.font.render(f"Y: {yellow_threshold:.2f}", True, (255, 255, 255))
+        green_text = render_text(f"G: {green_threshold:.2f}", (255, 255, 255))
+        yellow_text = render_text(f"Y: {yellow_threshold:.2f}", (255, 255, 255))
         self.screen.blit(green_text, (x - 100, green_pos - 10))
         self.screen.blit(yellow_text, (x - 100, yellow_pos - 10))
+        self.screen.set_clip(None)
+        return [area]
     
     def handle_click(self, pos):
         # Handle mouse click events
@@ -166,7 +397,7 @@ class Game:
         # Handle sensor click events
         for sensor in self.logic.sensor_manager.sensors:
             button_rect = self.get_sensor_button_rect(sensor)
-            if button_rect.collidepoint(pos):
+            if button_rect and button_rect.collidepoint(pos):
                 if sensor.connected:
                     sensor.active = not sensor.active
                 self.dragging_port = sensor
@@ -175,13 +406,7 @@ class Game:
     def handle_release(self, pos):
         # Handle mouse release events
         if self.dragging_port:
-            column_width = self.width // 3
-            if column_width <= pos[0] < column_width * 2:
-                self.dragging_port.column = "external"
-            elif column_width * 2 <= pos[0]:
-                self.dragging_port.column = "internal"
-            else:
-                self.dragging_port.column = "neutral"
+            self.dragging_port.column = self.sensor_view.column_at(pos[0])
             self.dragging_port = None
 
     def handle_slider_click(self, pos):
@@ -197,42 +422,26 @@ class Game:
             pass
 
     def get_sensor_button_rect(self, sensor):
-        # Get the rectangle for the sensor button
-        column_width = self.width // 3
-        row_height = 60
-        
-        if sensor.column == "neutral":
-            x = 50
-        elif sensor.column == "external":
-            x = column_width + 50
-        elif sensor.column == "internal":
-            x = column_width * 2 + 50
-        
-        y = 70 + (sensor.port - 1) * row_height
-        
-        return pygame.Rect(x, y, 100, 40)
+        # Get the rectangle for the sensor button, None while scrolled out of view
+        return self.sensor_view.button_rect(sensor)
 
     def handle_slider_drag(self, pos):
         # Handle slider drag events
         x, y = pos
         slider_x = self.width - 70
-        slider_height = self.height // 2 - 100
+        slider_height = self.panel_height - 75
 
-        if slider_x - 5 <= x <= slider_x + 45:
-            if 50 <= y <= 50 + slider_height:  # External oscilloscope
-                normalized_pos = 1 - (y - 50) / slider_height
-                value = normalized_pos * self.max_threshold_value
-                if abs(value - self.green_threshold_external) < abs(value - self.yellow_threshold_external):
-                    self.green_threshold_external = max(0, min(self.yellow_threshold_external, value))
-                else:
-                    self.yellow_threshold_external = max(self.green_threshold_external, min(self.max_threshold_value, value))
-            elif self.height // 2 + 50 <= y <= self.height // 2 + 50 + slider_height:  # Internal oscilloscope
-                normalized_pos = 1 - (y - (self.height // 2 + 50)) / slider_height
+        if slider_x - 5 <= x <= slider_x + 45 and y // self.panel_height < len(self.groups):
+            thresholds = self.thresholds[self.groups[y // self.panel_height]]
+            top = y // self.panel_height * self.panel_height + 50
+            if top <= y <= top + slider_height:
+                normalized_pos = 1 - (y - top) / slider_height
                 value = normalized_pos * self.max_threshold_value
-                if abs(value - self.green_threshold_internal) < abs(value - self.yellow_threshold_internal):
-                    self.green_threshold_internal = max(0, min(self.yellow_threshold_internal, value))
+                green, yellow = thresholds
+                if abs(value - green) < abs(value - yellow):
+                    thresholds[0] = max(0, min(yellow, value))
                 else:
-                    self.yellow_threshold_internal = max(self.green_threshold_internal, min(self.max_threshold_value, value))
+                    thresholds[1] = max(green, min(self.max_threshold_value, value))
 
 if __name__ == "__main__":
     game = Game()
@@ -0,0 +1,124 @@
+import functools
+import math
+import numpy as np
+
+MAX_BLOCK = 64  # ticks run through one block matrix; longer blocks go in chunks of this
+
+# Every filter is a cascade of biquads (b0, b1, b2, a1, a2), a0 normalized
+# to 1, run in transposed direct form II.
+
+def lowpass(cutoff, rate):
+    # 2nd-order Butterworth low-pass by the bilinear transform
+    w = _prewarp(cutoff, rate)
+    norm = 1 + math.sqrt(2) * w + w * w
+    b0 = w * w / norm
+    return (b0, 2 * b0, b0, 2 * (w * w - 1) / norm, (1 - math.sqrt(2) * w + w * w) / norm)
+
+def highpass(cutoff, rate):
+    # 2nd-order Butterworth high-pass by the bilinear transform
+    w = _prewarp(cutoff, rate)
+    norm = 1 + math.sqrt(2) * w + w * w
+    b0 = 1 / norm
+    return (b0, -2 * b0, b0, 2 * (w * w - 1) / norm, (1 - math.sqrt(2) * w + w * w) / norm)
+
+def cfc(channel_class, rate):
+    # SAE J211/1 channel frequency class filter, e.g. CFC 60 or 180. J211
+    # runs it forwards and backwards for zero phase; a live stream can only
+    # run it forwards, so this is the causal 2-pole half with its phase lag.
+    wd = 2 * math.pi * channel_class * 2.0775
+    if wd / (2 * math.pi) >= rate / 2:
+        raise ValueError(f"CFC {channel_class} needs more than {rate} samples per second")
+    wa = math.tan(wd / rate / 2)
+    norm = 1 + math.sqrt(2) * wa + wa * wa
+    a0 = wa * wa / norm
+    # J211 writes y = a0 x + a1 x' + a2 x'' + b1 y' + b2 y''
+    b1 = -2 * (wa * wa - 1) / norm
+    b2 = (-1 + math.sqrt(2) * wa - wa * wa) / norm
+    return (a0, 2 * a0, a0, -b1, -b2)
+
+def _prewarp(cutoff, rate):
+    if not 0 < cutoff < rate / 2:
+        raise ValueError(f"Cutoff {cutoff} Hz is outside 0-{rate / 2} Hz")
+    return math.tan(math.pi * cutoff / rate)
+
+DESIGNS = {"lowpass": lowpass, "highpass": highpass, "cfc": cfc}
+
+def design(spec, rate):
+    # One biquad from a {"type": "lowpass", "cutoff": 100} or
+    # {"type": "cfc", "class": 60} description
+    kind = spec.get("type")
+    if kind not in DESIGNS:
+        raise ValueError(f"Unknown filter type: {kind}")
+    return DESIGNS[kind](spec["class"] if kind == "cfc" else spec["cutoff"], rate)
+
+@functools.lru_cache(maxsize=256)
+def _block_matrices(section, length):
+    # The biquad unrolled over `length` samples as a linear map, so a whole
+    # block of every channel goes through in two matrix products:
+    #   y = T x + O s,  s' = A^length s + F x
+    # with s the two state values of each channel. T is length x length,
+    # which is why length never goes past MAX_BLOCK.
+    b0, b1, b2, a1, a2 = section
+    A = np.array([[-a1, 1.0], [-a2, 0.0]])
+    B = np.array([b1 - a1 * b0, b2 - a2 * b0])
+    C = np.array([1.0, 0.0])
+    powers = [np.eye(2)]
+    for _ in range(length):
+        powers.append(A @ powers[-1])
+    O = np.array([C @ powers[k] for k in range(length)])
+    impulse = np.array([b0] + [C @ powers[k] @ B for k in range(length - 1)])
+    lags = np.subtract.outer(np.arange(length), np.arange(length))
+    T = np.where(lags >= 0, impulse[np.clip(lags, 0, None)], 0.0)
+    F = np.array([powers[length - 1 - j] @ B for j in range(length)]).T
+    return T, O, powers[length], F
+
+class FilterBank:
+    # One chain of biquads applied to many channels at once: a block of
+    # (ticks, sensors, 3) samples goes through each section as a single
+    # matrix product over every sensor and axis. Each sensor's state carries
+    # over between blocks; a sensor that missed ticks (or is new) starts from
+    # the steady state for its first sample instead of ringing up from zero.
+    def __init__(self, sections):
+        self.sections = [tuple(float(value) for value in section) for section in sections]
+        self._states = {}  # key -> (sections, 2, 3)
+        self._next = {}  # key -> tick index the state is ready for
+
+    def apply(self, keys, block, first):
+        # block: (ticks, len(keys), 3), the ticks numbered from `first`
+        length, count, _ = block.shape
+        if not self.sections or not length or not count:
+            return block
+        states = np.empty((len(self.sections), 2, count, 3))
+        for k, key in enumerate(keys):
+            state = self._states.get(key)
+            if state is None or self._next.get(key) != first:
+                state = self._steady_state(block[0, k])
+            states[:, :, k] = state
+
+        x = block.reshape(length, count * 3)
+        for i, section in enumerate(self.sections):
+            s = states[i].reshape(2, count * 3)
+            y = np.empty_like(x)
+            # Chunks of at most MAX_BLOCK keep the cost linear in the block length
+            for start in range(0, length, MAX_BLOCK):
+                chunk = x[start:start + MAX_BLOCK]
+                T, O, A, F = _block_matrices(section, len(chunk))
+                y[start:start + MAX_BLOCK] = T @ chunk + O @ s
+                s = A @ s + F @ chunk
+            states[i] = s.reshape(2, count, 3)
+            x = y
+
+        for k, key in enumerate(keys):
+            self._states[key] = states[:, :, k].copy()
+            self._next[key] = first + length
+        return x.reshape(length, count, 3)
+
+    def _steady_state(self, x0):
+        # Section states that make a constant input x0 pass straight through
+        state = np.empty((len(self.sections), 2, 3))
+        for i, (b0, b1, b2, a1, a2) in enumerate(self.sections):
+            y0 = x0 * (b0 + b1 + b2) / (1 + a1 + a2)
+            state[i, 0] = y0 - b0 * x0
+            state[i, 1] = b2 * x0 - a2 * y0
+            x0 = y0
+        return state
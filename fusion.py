@@ -0,0 +1,165 @@
+import math
+import numpy as np
+
+FUSION_RATE = 1000  # Hz of the common time grid
+LATENCY_MARGIN = 0.05  # s; a tick is only emitted once every board has had time to deliver it
+HISTORY = 0.5  # s of aligned samples kept per sensor to interpolate from
+DEVICE_RESOLUTION = 0.01  # rtcTime is printed in hundredths of a second
+CLOCK_MEMORY = 30.0  # s of device time the clock fit effectively remembers
+MAX_DRIFT = 0.01
+
+TICK_DTYPE = np.dtype([('t', 'f8'), ('x', 'f8'), ('y', 'f8'), ('z', 'f8')])
+
+class SensorClock:
+    # Maps one board's rtc time onto the host's monotonic clock,
+    #   host = offset + drift * device,
+    # fitted by exponentially weighted least squares over (device, host) pairs.
+    # rtcTime only has hundredths, so samples sharing a device stamp are first
+    # spread out at the board's estimated sample rate.
+    def __init__(self, resolution=DEVICE_RESOLUTION, memory=CLOCK_MEMORY):
+        self.resolution = resolution
+        self.memory = memory
+        self.offset = 0.0
+        self.drift = 1.0
+        self.rate = None  # samples per device second
+        self._origin = None  # (device, host) the fit is centred on
+        self._sums = np.zeros(5)  # weight, x, y, xx, xy
+        self._last_device = None
+        self._run = 0  # samples already seen carrying _last_device
+        self._first_device = None
+        self._count = 0
+
+    def align(self, samples):
+        # Host-clock times for a batch, from the device stamps where they parse
+        # and the host read times where they don't
+        aligned = samples['t'].copy()
+        valid = ~np.isnan(samples['device_t'])
+        if not valid.any():
+            return aligned
+        if self._last_device is not None and samples['device_t'][valid][0] < self._last_device - 1.0:
+            self.__init__(self.resolution, self.memory)  # the board restarted or the replay looped
+        device = self._dequantize(samples['device_t'][valid])
+        self._fit(device, samples['t'][valid])
+        aligned[valid] = self._origin[1] + self.offset + self.drift * (device - self._origin[0])
+        return aligned
+
+    def _dequantize(self, device):
+        n = len(device)
+        previous = np.concatenate(([self._last_device if self._last_device is not None else np.nan], device[:-1]))
+        new_run = device != previous
+        position = np.arange(n)
+        starts = np.where(new_run, position, -1 << 62)
+        starts[0] = 0 if new_run[0] else -self._run
+        index = position - np.maximum.accumulate(starts)
+        self._last_device = device[-1]
+        self._run = int(index[-1]) + 1
+
+        if self._first_device is None:
+            self._first_device = device[0]
+        self._count += n
+        span = device[-1] - self._first_device
+        if span >= 1.0:
+            self.rate = self._count / span
+        if not self.rate:
+            return device
+        return device + np.minimum(index / self.rate, self.resolution * 0.999)
+
+    def _fit(self, device, host):
+        if self._origin is None:
+            self._origin = (device[0], host[0])
+        x = device - self._origin[0]
+        y = host - self._origin[1]
+        # Forget old pairs by how much device time has passed, not by sample count
+        if self._sums[0]:
+            self._sums *= math.exp(-max(0.0, x[-1] - self._last_x) / self.memory)
+        self._last_x = x[-1]
+        self._sums += (len(x), x.sum(), y.sum(), (x * x).sum(), (x * y).sum())
+
+        weight, sx, sy, sxx, sxy = self._sums
+        variance = sxx - sx * sx / weight
+        if variance / weight > 0.25 ** 2:
+            drift = (sxy - sx * sy / weight) / variance
+            self.drift = min(max(drift, 1 - MAX_DRIFT), 1 + MAX_DRIFT)
+        self.offset = (sy - self.drift * sx) / weight
+
+def membership(columns, sensors):
+    # (columns, sensors) matrix with 1.0 where the sensor is summed into the column
+    return np.array([[sensor.column == column for sensor in sensors] for column in columns], dtype=float).reshape(len(columns), len(sensors))
+
+class FusionStage:
+    # Puts every sensor on a common time grid and sums each column per tick,
+    # instead of adding up whatever sample each board happened to send last.
+    # add() aligns a sensor's batch onto the host clock; tick() interpolates
+    # every active sensor onto the grid up to `now - margin`, where `filters`
+    # (a FilterBank) can smooth each sensor before the columns are summed.
+    tick_dtype = TICK_DTYPE
+
+    def __init__(self, rate=FUSION_RATE, margin=LATENCY_MARGIN, history=HISTORY, columns=("external", "internal"), filters=None):
+        self.rate = rate
+        self.margin = margin
+        self.history = history
+        self.columns = columns
+        self.filters = filters
+        self.clocks = {}
+        self.latest = {column: (0.0, 0.0, 0.0) for column in columns}
+        self._samples = {}  # port -> (aligned times, (n, 3) xyz)
+        self._next_tick = None
+
+    def add(self, sensor, samples):
+        clock = self.clocks.get(sensor.port)
+        if clock is None:
+            clock = self.clocks[sensor.port] = SensorClock()
+        aligned = clock.align(samples)
+
+        xyz = np.column_stack((samples['x'], samples['y'], samples['z']))
+        if sensor.port in self._samples:
+            old_t, old_xyz = self._samples[sensor.port]
+            aligned_all = np.concatenate((old_t, aligned))
+            xyz = np.concatenate((old_xyz, xyz))
+        else:
+            aligned_all = aligned
+        keep = aligned_all >= aligned_all[-1] - self.history
+        self._samples[sensor.port] = (aligned_all[keep], xyz[keep])
+        return aligned
+
+    def tick(self, sensors, now):
+        # Column sums for every grid tick that became ready since the last call,
+        # as {column: TICK_DTYPE array}
+        last = math.floor((now - self.margin) * self.rate)
+        if self._next_tick is None:
+            self._next_tick = last
+        # After a long pause only the ticks we still have samples for are worth making
+        first = max(self._next_tick, last - int(self.history * self.rate) + 1)
+        if last < first:
+            return {}
+        grid = np.arange(first, last + 1) / self.rate
+        self._next_tick = last + 1
+
+        # Every summed sensor on the grid as one (ticks, sensors, 3) block.
+        # A board that dropped out or went quiet is left out: np.interp would
+        # hold its last sample and add it to the column forever.
+        summed = [
+            sensor for sensor in sensors
+            if sensor.active and sensor.connected and sensor.column in self.columns
+            and sensor.port in self._samples and self._samples[sensor.port][0][-1] >= grid[0] - self.margin
+        ]
+        resampled = np.empty((len(grid), len(summed), 3))
+        for k, sensor in enumerate(summed):
+            t, xyz = self._samples[sensor.port]
+            for axis in range(3):
+                resampled[:, k, axis] = np.interp(grid, t, xyz[:, axis])
+        if self.filters:
+            resampled = self.filters.apply([sensor.port for sensor in summed], resampled, first)
+        # Every column's sum in one masked reduction
+        totals = dict(zip(self.columns, np.einsum('cs,tsa->cta', membership(self.columns, summed), resampled)))
+
+        ticks = {}
+        for column, total in totals.items():
+            batch = np.empty(len(grid), dtype=TICK_DTYPE)
+            batch['t'] = grid
+            batch['x'] = total[:, 0]
+            batch['y'] = total[:, 1]
+            batch['z'] = total[:, 2]
+            ticks[column] = batch
+            self.latest[column] = tuple(total[-1])
+        return ticks
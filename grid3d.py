@@ -1,13 +1,23 @@
 import pygame
 import math
+import numpy as np
+from text_cache import get_font
+
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+DARK_BLUE = (0, 0, 255)
+BLACK = (0, 0, 0)
 
 class Grid3D:
-    def __init__(self, width, height):
+    def __init__(self, width, height, scale=50, font_size=24):
         self.width = width
         self.height = height
         self.origin = (width // 2, height // 2)
-        self.scale = 50  # pixels per unit
-        self.axis_font = pygame.font.Font(None, 24)
+        self.scale = scale  # pixels per unit
+        self.axis_font = get_font(font_size)
+        self._background = None
+        self._background_key = None
+        self._background_pos = (0, 0)
 
     def project_3d_to_2d(self, x, y, z, offset):
         if y < 0:
@@ -17,52 +27,83 @@ class Grid3D:
         projected_y = self.origin[1] + self.scale * (-y + (-x + (-z)) / math.sqrt(6))
         return (projected_x + offset[0], projected_y + offset[1])
 
-    def draw_3d_visualization(self, surface, vector, offset):
-        WHITE = (255, 255, 255)
-        RED = (255, 0, 0)
-        DARK_BLUE = (0, 0, 255)
+    def project_points(self, points, offset):
+        # Same projection as project_3d_to_2d for an (N, 3) array of points at once
+        points = np.asarray(points, dtype=float)
+        x = np.where(points[:, 1] < 0, -points[:, 0], points[:, 0])
+        y = points[:, 1]
+        z = points[:, 2]
+        projected = np.empty((len(points), 2))
+        projected[:, 0] = self.origin[0] + self.scale * (z - x) / math.sqrt(2) + offset[0]
+        projected[:, 1] = self.origin[1] + self.scale * (-y + (-x - z) / math.sqrt(6)) + offset[1]
+        return projected
+
+    def get_background(self):
+        # Axes and labels never move, so render them once to a surface just big
+        # enough to hold them and only redo it when the size, origin or scale
+        # change. The offset only moves the blit.
+        key = (self.width, self.height, self.origin, self.scale)
+        if self._background is None or key != self._background_key:
+            axis_length = 2
+            axes = self.project_points([
+                (-axis_length, 0, 0), (axis_length, 0, 0),
+                (0, -axis_length, 0), (0, axis_length, 0),
+                (0, 0, -axis_length), (0, 0, axis_length)
+            ], (0, 0))
+            labels = [(self.axis_font.render(name, True, WHITE), axes[i]) for name, i in (("X", 1), ("Y", 3), ("Z", 4))]
+
+            corners = [axes.min(axis=0) - 2, axes.max(axis=0) + 2]
+            corners += [pos + label.get_size() for label, pos in labels]
+            left, top = np.floor(np.min(corners, axis=0)).astype(int)
+            right, bottom = np.ceil(np.max(corners, axis=0)).astype(int)
 
-        # Draw the 3D axis lines
-        axis_length = 2
-        pygame.draw.line(surface, WHITE, self.project_3d_to_2d(-axis_length, 0, 0, offset), self.project_3d_to_2d(axis_length, 0, 0, offset), 2)
-        pygame.draw.line(surface, WHITE, self.project_3d_to_2d(0, -axis_length, 0, offset), self.project_3d_to_2d(0, axis_length, 0, offset), 2)
-        pygame.draw.line(surface, WHITE, self.project_3d_to_2d(0, 0, -axis_length, offset), self.project_3d_to_2d(0, 0, axis_length, offset), 2)
+            self._background = pygame.Surface((right - left, bottom - top))
+            self._background.set_colorkey(BLACK)
+            self._background_pos = (left, top)
+
+            # Draw the 3D axis lines
+            axes = (axes - (left, top)).tolist()
+            for i in range(0, 6, 2):
+                pygame.draw.line(self._background, WHITE, axes[i], axes[i + 1], 2)
+
+            # Label axes
+            for label, pos in labels:
+                self._background.blit(label, (pos[0] - left, pos[1] - top))
+            self._background_key = key
+        return self._background
+
+    def draw_3d_visualization(self, surface, vector, offset):
+        self.draw_vectors([surface], [vector], [offset])
 
-        # Label axes
-        x_label = self.axis_font.render("X", True, WHITE)
-        y_label = self.axis_font.render("Y", True, WHITE)
-        z_label = self.axis_font.render("Z", True, WHITE)
-        
-        surface.blit(x_label, self.project_3d_to_2d(axis_length, 0, 0, offset))
-        surface.blit(y_label, self.project_3d_to_2d(0, axis_length, 0, offset))
-        surface.blit(z_label, self.project_3d_to_2d(0, 0, -axis_length, offset))
-        
-        # Draw 3D vector (red line)
-        start = self.project_3d_to_2d(0, 0, 0, offset)
-        end = self.project_3d_to_2d(vector[0], vector[1], vector[2], offset)
-        pygame.draw.line(surface, RED, start, end, 3)
+    def draw_vectors(self, surfaces, vectors, offsets):
+        # draw_3d_visualization for many vectors at once, each onto its own
+        # surface (e.g. subsurfaces of one atlas, which also clip them); every
+        # box is projected in a single NumPy call
+        background = self.get_background()
+        vectors = np.asarray(vectors, dtype=float).reshape(-1, 3)
+        offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+        x, y, z = vectors.T
+        flipped = np.where(y < 0, -x, x)
+        zero = np.zeros(len(vectors))
+        boxes = np.stack([
+            (zero, zero, zero),
+            (flipped, zero, zero),
+            (x, y, zero),
+            (zero, y, zero),
+            (zero, zero, z),
+            (flipped, zero, z),
+            (x, y, z),
+            (zero, y, z)
+        ]).transpose(2, 0, 1)
+        projected = self.project_points(boxes.reshape(-1, 3), (0, 0)).reshape(-1, 8, 2) + offsets[:, None]
 
-        X_value = vector[0]
-        Y_value = vector[1]
-        Z_value = vector[2]
+        for surface, box_points, offset in zip(surfaces, projected.tolist(), offsets.tolist()):
+            surface.blit(background, (offset[0] + self._background_pos[0], offset[1] + self._background_pos[1]))
 
-        if Y_value < 0:
-            multiplier = -1
-        else:
-            multiplier = 1
+            # Draw 3D vector (red line) from the origin to the far corner
+            pygame.draw.line(surface, RED, box_points[0], box_points[6], 3)
 
-        box_points = [
-            (0, 0, 0),
-            (X_value * multiplier, 0, 0),
-            (X_value, Y_value, 0),
-            (0, Y_value, 0),
-            (0, 0, Z_value),
-            (X_value * multiplier, 0, Z_value),
-            (X_value, Y_value, Z_value),
-            (0, Y_value, Z_value)
-        ]
-        
-        for i in range(4):
-            pygame.draw.line(surface, DARK_BLUE, self.project_3d_to_2d(*box_points[i], offset), self.project_3d_to_2d(*box_points[(i+1)%4], offset), 2)
-            pygame.draw.line(surface, DARK_BLUE, self.project_3d_to_2d(*box_points[i+4], offset), self.project_3d_to_2d(*box_points[(i+1)%4+4], offset), 2)
-            pygame.draw.line(surface, DARK_BLUE, self.project_3d_to_2d(*box_points[i], offset), self.project_3d_to_2d(*box_points[i+4], offset), 2)
+            pygame.draw.lines(surface, DARK_BLUE, True, box_points[:4], 2)
+            pygame.draw.lines(surface, DARK_BLUE, True, box_points[4:], 2)
+            for i in range(4):
+                pygame.draw.line(surface, DARK_BLUE, box_points[i], box_points[i + 4], 2)
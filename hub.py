@@ -0,0 +1,152 @@
+import collections
+import threading
+import time
+
+QUEUE_LENGTH = 64  # messages per client, ~3 s of frames at the default stream interval
+POLICIES = ("drop-oldest", "latest")
+
+class HubClient:
+    # One viewer's outbox and the thread that drains it. A viewer that can't
+    # keep up only ever blocks its own thread; its queue stays bounded by
+    # either dropping the oldest message ("drop-oldest") or keeping just the
+    # newest message of each event ("latest"). Events named in `reliable`
+    # are never coalesced, only dropped once the queue is full.
+    def __init__(self, sid, emit, policy="drop-oldest", maxlen=QUEUE_LENGTH, prepare=None, reliable=()):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.sid = sid
+        self.policy = policy
+        self.maxlen = maxlen
+        self.reliable = reliable
+        # Turns a published (event, payload) into what this client gets, or None to skip it
+        self.prepare = prepare
+        self.sent = 0
+        self.dropped = 0
+        self.max_lag = 0.0
+        self._emit = emit
+        self._queue = collections.deque()  # (event, payload, published at)
+        self._latest = {}  # event -> (payload, published at), for "latest"
+        self._ready = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"client {sid}", daemon=True)
+        self._thread.start()
+
+    def put(self, event, payload, published):
+        with self._ready:
+            if self.policy == "latest" and event not in self.reliable:
+                if event in self._latest:
+                    self.dropped += 1
+                self._latest[event] = (payload, published)
+            else:
+                if len(self._queue) >= self.maxlen:
+                    self._queue.popleft()
+                    self.dropped += 1
+                self._queue.append((event, payload, published))
+            self._ready.notify()
+
+    def _next(self):
+        with self._ready:
+            while not self._closed and not self._queue and not self._latest:
+                self._ready.wait()
+            if self._closed:
+                return None
+            if self._queue:
+                return self._queue.popleft()
+            # Oldest pending event first, so one busy event can't starve the others
+            event = min(self._latest, key=lambda name: self._latest[name][1])
+            payload, published = self._latest.pop(event)
+            return event, payload, published
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                break
+            event, payload, published = item
+            if self.prepare:
+                prepared = self.prepare(event, payload)
+                if prepared is None:
+                    continue
+                event, payload = prepared
+            self.max_lag = max(self.max_lag, time.monotonic() - published)
+            try:
+                self._emit(event, payload, to=self.sid)
+            except Exception:
+                # A viewer that went away mid-send; its disconnect will remove it
+                self.dropped += 1
+                continue
+            self.sent += 1
+
+    def stats(self):
+        with self._ready:
+            waiting = [published for _, _, published in self._queue] + [published for _, published in self._latest.values()]
+        return {
+            "sid": self.sid,
+            "policy": self.policy,
+            "queued": len(waiting),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lag": time.monotonic() - min(waiting) if waiting else 0.0,
+            "max_lag": self.max_lag,
+        }
+
+    def close(self, timeout=None):
+        # Only waits for the sender when given a timeout; a disconnect handler
+        # shouldn't sit behind a send that is stuck on a dead connection
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+        if timeout and threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+class BroadcastHub:
+    # Sits between the acquisition loop and Flask-SocketIO: publish() only
+    # appends to each client's bounded queue and returns, however many
+    # viewers there are and however slow their connections. emit is
+    # socketio.emit or anything with the same (event, payload, to=sid) call.
+    def __init__(self, emit, policy="drop-oldest", maxlen=QUEUE_LENGTH, reliable=()):
+        self.emit = emit
+        self.policy = policy
+        self.maxlen = maxlen
+        self.reliable = reliable
+        self.published = 0
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def add(self, sid, policy=None, prepare=None):
+        client = HubClient(sid, self.emit, policy or self.policy, self.maxlen, prepare, self.reliable)
+        with self._lock:
+            old = self._clients.get(sid)
+            self._clients[sid] = client
+        if old:
+            old.close()
+        return client
+
+    def get(self, sid):
+        return self._clients.get(sid)
+
+    def remove(self, sid):
+        with self._lock:
+            client = self._clients.pop(sid, None)
+        if client:
+            client.close()
+
+    def publish(self, event, payload):
+        published = time.monotonic()
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            client.put(event, payload, published)
+        self.published += 1
+
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients.values())
+        return [client.stats() for client in clients]
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients = {}
+        for client in clients:
+            client.close(timeout=2)
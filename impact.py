@@ -0,0 +1,127 @@
+import collections
+import numpy as np
+
+HIC_WINDOWS = {"hic15": 0.015, "hic36": 0.036}
+MAX_IMPACTS = 50
+
+def resultant(samples):
+    return np.sqrt(samples['x'] ** 2 + samples['y'] ** 2 + samples['z'] ** 2)
+
+def head_injury_criterion(t, a, max_window):
+    # HIC = max over t1 < t2 with t2 - t1 <= max_window of
+    #   (t2 - t1) * (1 / (t2 - t1) * integral of a(t) dt from t1 to t2) ** 2.5
+    # with a in g and t in seconds. The integral comes from one prefix sum and
+    # every (start, end) pair within max_window is evaluated in one broadcast
+    # (starts x sample lags) array, so no Python loop runs per sample or lag.
+    # Returns (hic, t1, t2).
+    if len(t) < 2:
+        return 0.0, None, None
+    integral = np.concatenate(([0.0], np.cumsum((a[1:] + a[:-1]) / 2 * np.diff(t))))
+    # Timestamps only grow, so the longest window in samples bounds the lags
+    last = np.searchsorted(t, t + max_window + 1e-9, side='right') - 1
+    lags = np.arange(1, max(int((last - np.arange(len(t))).max()), 0) + 1)
+    if not len(lags):
+        return 0.0, None, None
+    starts = np.arange(len(t))[:, None]
+    ends = np.minimum(starts + lags, len(t) - 1)
+    dt = t[ends] - t[starts]
+    valid = (starts + lags < len(t)) & (dt > 0) & (dt <= max_window + 1e-9)
+    if not valid.any():
+        return 0.0, None, None
+    average = np.maximum(integral[ends] - integral[starts], 0) / np.where(valid, dt, 1)
+    hic = np.where(valid, dt * average ** 2.5, 0)
+    i, lag = np.unravel_index(int(np.argmax(hic)), hic.shape)
+    if not hic[i, lag] > 0:
+        return 0.0, None, None
+    return float(hic[i, lag]), float(t[i]), float(t[ends[i, lag]])
+
+def impact_metrics(t, a, threshold):
+    # Peak resultant g, time spent above threshold and HIC15/HIC36 of one impact
+    dt = np.diff(t, append=t[-1])
+    metrics = {
+        "start": float(t[0]),
+        "end": float(t[-1]),
+        "peak_g": float(a.max()),
+        "peak_time": float(t[int(np.argmax(a))]),
+        "duration_above": float(dt[a >= threshold].sum()),
+        "samples": len(t),
+    }
+    for name, window in HIC_WINDOWS.items():
+        metrics[name] = head_injury_criterion(t, a, window)[0]
+    return metrics
+
+class ImpactDetector:
+    # Watches one sensor's resultant acceleration. An impact starts when it
+    # crosses `threshold` and ends once it has stayed below for `hold` seconds,
+    # or after `max_duration` if it never settles; `pre` seconds before the
+    # crossing are kept so the HIC integral sees the rising edge.
+    def __init__(self, threshold=2.0, hold=0.05, pre=0.01, max_duration=1.0):
+        self.threshold = threshold
+        self.hold = hold
+        self.pre = pre
+        self.max_duration = max_duration
+        self._t = np.empty(0)
+        self._a = np.empty(0)
+        self._in_impact = False
+
+    def feed(self, t, a):
+        # Returns the metrics of every impact that finished within this batch
+        finished = []
+        self._t = np.concatenate((self._t, t))
+        self._a = np.concatenate((self._a, a))
+        while len(self._t):
+            if not self._in_impact:
+                above = np.flatnonzero(self._a >= self.threshold)
+                if not len(above):
+                    # Quiet: only keep the pre-trigger tail
+                    keep = self._t >= self._t[-1] - self.pre
+                    self._t, self._a = self._t[keep], self._a[keep]
+                    break
+                start = np.searchsorted(self._t, self._t[above[0]] - self.pre)
+                self._t, self._a = self._t[start:], self._a[start:]
+                self._in_impact = True
+
+            # The buffer now starts at the impact, so it holds every sample above threshold
+            last_above = self._t[np.flatnonzero(self._a >= self.threshold)[-1]]
+            if self._t[-1] - last_above >= self.hold:
+                end = np.searchsorted(self._t, last_above + self.hold, side='right')
+            elif self._t[-1] - self._t[0] >= self.max_duration:
+                end = np.searchsorted(self._t, self._t[0] + self.max_duration, side='right')
+            else:
+                break
+            finished.append(impact_metrics(self._t[:end], self._a[:end], self.threshold))
+            self._t, self._a = self._t[end:], self._a[end:]
+            self._in_impact = False
+        return finished
+
+class ImpactMonitor:
+    # One ImpactDetector per sensor, fed straight from the sample batches.
+    # Thresholds are per column so they can follow the display's yellow levels.
+    def __init__(self, threshold=2.0):
+        self.default_threshold = threshold
+        self.thresholds = {}
+        self.detectors = {}
+        self.impacts = collections.deque(maxlen=MAX_IMPACTS)
+        self.impact_count = 0
+
+    def feed(self, sensor, samples):
+        detector = self.detectors.get(sensor.port)
+        if detector is None:
+            detector = self.detectors[sensor.port] = ImpactDetector(self.default_threshold)
+        detector.threshold = self.thresholds.get(sensor.column, self.default_threshold)
+        for metrics in detector.feed(samples['t'], resultant(samples)):
+            metrics["port"] = sensor.port
+            metrics["column"] = sensor.column
+            self.impacts.append(metrics)
+            self.impact_count += 1
+
+    def latest(self, column=None):
+        for metrics in reversed(self.impacts):
+            if column is None or metrics["column"] == column:
+                return metrics
+        return None
+
+    def since(self, count):
+        # Impacts recorded after the first `count`, for consumers that poll
+        new = self.impact_count - count
+        return list(self.impacts)[-new:] if new > 0 else []
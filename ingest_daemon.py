@@ -0,0 +1,80 @@
+import argparse
+import signal
+import sys
+import threading
+from recording import SessionReplay
+from discovery import discover
+from sensors_logic import MAX_SENSORS, SensorManager, configured_groups
+from shared_stream import STREAM_CAPACITY, STREAM_NAME, SharedStream
+
+PUBLISH_INTERVAL = 0.1  # s between sensor state / heartbeat updates
+
+class IngestDaemon:
+    # Owns the serial ports and publishes every sample into a SharedStream,
+    # so display.py and app.py can run side by side as clients
+    # (MACPARKMAN_INGEST=shared). The Sensors write straight into the shared
+    # rings; this process does nothing else, so acquisition gets its own core
+    # and no viewer can hold it up. The shared block is sized for the boards
+    # found at startup, so dropped ones are reconnected but new ones aren't added.
+    # groups (MACPARKMAN_GROUPS by default) go into the block for the clients.
+    def __init__(self, devices=None, ingest_mode="threads", name=STREAM_NAME, capacity=STREAM_CAPACITY, record=None, replay=None, replay_speed=1.0, groups=None):
+        if devices is None and not replay:
+            devices = discover()[:MAX_SENSORS]
+        groups = configured_groups(groups)
+        self.manager = SensorManager(ingest_mode, devices, SessionReplay(replay, replay_speed) if replay else None, groups=groups)
+        self.stream = SharedStream.create(self.manager.sensors, name, capacity, groups)
+        for sensor, ring in zip(self.manager.sensors, self.stream.rings):
+            sensor.ring = ring
+        self.record = record
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self.manager.connect_sensors()
+        if self.record:
+            self.manager.start_recording(self.record)
+        self._thread = threading.Thread(target=self._publish_loop, name="publisher", daemon=True)
+        self._thread.start()
+
+    def _publish_loop(self):
+        while not self._stop.is_set():
+            self.stream.publish(self.manager.sensors)
+            self._stop.wait(PUBLISH_INTERVAL)
+
+    def wait(self):
+        self._stop.wait()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.manager.close_sensors()
+        self.stream.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the sensors and share their samples with display.py and app.py")
+    parser.add_argument("devices", nargs="*", help="serial devices to open (default: every port an Artemis answers on)")
+    parser.add_argument("--mode", choices=("threads", "selector"), default="threads")
+    parser.add_argument("--name", default=STREAM_NAME, help="shared memory block to publish")
+    parser.add_argument("--capacity", type=int, default=STREAM_CAPACITY, help="samples kept per sensor")
+    parser.add_argument("--record", help="also record the session to this file")
+    parser.add_argument("--replay", help="publish a recorded session instead of reading ports")
+    parser.add_argument("--replay-speed", type=float, default=1.0)
+    parser.add_argument("--groups", help="comma-separated sensor groups (default: MACPARKMAN_GROUPS or external,internal)")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.devices or None, args.mode, args.name, args.capacity, args.record, args.replay, args.replay_speed, args.groups.split(",") if args.groups else None)
+    # Let a plain kill shut down cleanly too, so the block gets unlinked
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    daemon.start()
+    print(f"Publishing {len(daemon.manager.sensors)} sensors to '{args.name}'")
+    try:
+        daemon.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+if __name__ == "__main__":
+    main()
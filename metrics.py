@@ -0,0 +1,114 @@
+import bisect
+import threading
+
+# Seconds, from a fast ring read up to a serial read that waited out its timeout
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Cheap enough to leave on: updating a metric is a few attribute operations
+# (plus a bisect for histograms) with no locking. Each metric is only ever
+# updated from one thread, e.g. its sensor's reader, so nothing is lost;
+# scrapes read values that may be a moment old.
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Registry:
+    # Metric families by name, each holding one metric per label set.
+    # Collectors run before every render() to refresh gauges that are
+    # cheaper to compute on demand than to keep up to date.
+    def __init__(self):
+        self._families = {}  # name -> (kind, description, {label items: metric})
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, description, labels, *args):
+        family = self._families.get(name)
+        key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+        metric = family[2].get(key) if family else None
+        if metric is None:
+            with self._lock:
+                family = self._families.setdefault(name, (cls.kind, description, {}))
+                metric = family[2].setdefault(key, cls(*args))
+        return metric
+
+    def counter(self, name, description, **labels):
+        return self._get(Counter, name, description, labels)
+
+    def gauge(self, name, description, **labels):
+        return self._get(Gauge, name, description, labels)
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS, **labels):
+        return self._get(Histogram, name, description, labels, buckets)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def collect(self):
+        for collector in list(self._collectors):
+            collector()
+
+    def family(self, name):
+        # {label items: metric} for one name, e.g. every port's line counter
+        family = self._families.get(name)
+        return dict(family[2]) if family else {}
+
+    def render(self):
+        # Prometheus text exposition format
+        self.collect()
+        lines = []
+        with self._lock:
+            families = sorted((name, kind, description, list(metrics.items())) for name, (kind, description, metrics) in self._families.items())
+        for name, kind, description, metrics in families:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in sorted(metrics, key=lambda item: item[0]):
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(key)} {metric.value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ("+Inf",), metric.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(key + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(key)} {metric.sum}")
+                lines.append(f"{name}_count{_labels(key)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+def _labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{label}="{value}"' for label, value in key) + "}"
+
+REGISTRY = Registry()
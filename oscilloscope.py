@@ -1,39 +1,152 @@
+import numpy as np
 import pygame
 
+MAX_BLOCK = 64  # columns per block of the running max
+EDGE = 2  # left columns redrawn after a scroll, as wide as a trace line
+
+BLACK = (0, 0, 0)
+GREEN = (0, 255, 0)
+YELLOW = (255, 255, 0)
+RED = (255, 0, 0)
+COLORS = (GREEN, YELLOW, RED)  # below green, below yellow, above yellow
+
 class Oscilloscope:
-    def __init__(self, width, height):
+    # surface is where the trace is kept between frames, e.g. a subsurface
+    # of an atlas several traces share; by default it gets one of its own
+    def __init__(self, width, height, samples_per_column=1, surface=None):
         self.width = width
         self.height = height
-        self.data = []
-        self.max_data_points = width
+        self.samples_per_column = samples_per_column
+        # Circular buffer of per-column envelopes: each pixel column keeps the min
+        # and max of the samples that landed in it, so short impact spikes are
+        # never decimated away
+        self.col_min = np.zeros(width)
+        self.col_max = np.zeros(width)
+        self.columns = 0  # total columns ever completed
+        self._pending = np.empty(0)  # samples of the column still filling up
+        # Max of each block of columns, refreshed only for blocks that change
+        self._block_max = np.zeros(-(-width // MAX_BLOCK))
+        self.max_magnitude = 0
+        self._surface = surface
+        self._drawn_columns = 0
+        self._draw_key = None
 
     def update(self, magnitude):
-        self.data.append(magnitude)
-        if len(self.data) > self.max_data_points:
-            self.data.pop(0)
+        self.extend((magnitude,))
+
+    def extend(self, magnitudes):
+        samples = np.concatenate((self._pending, np.asarray(magnitudes, dtype=float)))
+        n_cols = len(samples) // self.samples_per_column
+        self._pending = samples[n_cols * self.samples_per_column:]
+        if not n_cols:
+            return
+
+        cols = samples[:n_cols * self.samples_per_column].reshape(n_cols, self.samples_per_column)
+        lo = cols.min(axis=1)[-self.width:]
+        hi = cols.max(axis=1)[-self.width:]
+        self.columns += n_cols - len(hi)  # columns that scrolled straight off screen
+
+        idx = (self.columns + np.arange(len(hi))) % self.width
+        self.col_min[idx] = lo
+        self.col_max[idx] = hi
+        self.columns += len(hi)
+
+        for block in np.unique(idx // MAX_BLOCK):
+            self._block_max[block] = self.col_max[block * MAX_BLOCK:(block + 1) * MAX_BLOCK].max()
+        self.max_magnitude = self._block_max.max()
+
+    def visible_columns(self):
+        # Oldest to newest (min, max) envelopes currently on screen
+        n = min(self.columns, self.width)
+        order = (self.columns - n + np.arange(n)) % self.width
+        return self.col_min[order], self.col_max[order]
 
     def draw(self, surface, green_threshold, yellow_threshold, offset):
-        if not self.data:
+        if not self.columns:
             return
+        self.render(green_threshold, yellow_threshold)
+        surface.blit(self._surface, offset)
+
+    def render(self, green_threshold, yellow_threshold):
+        # Bring the trace surface up to date without blitting it anywhere;
+        # returns whether anything on it changed
+        if not self.columns:
+            return False
 
-        GREEN = (0, 255, 0)
-        YELLOW = (255, 255, 0)
-        RED = (255, 0, 0)
+        scale_factor = 3 / self.max_magnitude if self.max_magnitude > 3 else 1
 
-        max_magnitude = max(self.data)
-        scale_factor = 3 / max_magnitude if max_magnitude > 3 else 1
+        # The trace lives on a persistent surface: normally we only scroll it left
+        # by the number of new columns and draw those, and rebuild it from scratch
+        # when the thresholds or the autoscale change
+        lo, hi = self.visible_columns()
+        new = self.columns - self._drawn_columns
+        key = (green_threshold, yellow_threshold, scale_factor)
+        if self._surface is None or key != self._draw_key or new >= len(hi) - 1:
+            if self._surface is None:
+                self._surface = pygame.Surface((self.width, self.height))
+            self._surface.fill(BLACK)
+            self._draw_columns(lo, hi, 0, green_threshold, yellow_threshold, scale_factor)
+        elif new:
+            self._surface.scroll(-new, 0)
+            # Index and x of the column that was newest on the last frame
+            previous = len(hi) - 1 - new
+            x = self.width - len(hi) + previous
+            self._surface.fill(BLACK, (x + 1, 0, self.width - x - 1, self.height))
+            self._draw_columns(lo, hi, previous - 2, green_threshold, yellow_threshold, scale_factor)
+            if len(hi) == self.width:
+                # The first columns still hold the tail of the segment from the
+                # column that just scrolled off; clear them and redraw what
+                # belongs there, clipped so nothing further right changes
+                self._surface.set_clip((0, 0, EDGE, self.height))
+                self._surface.fill(BLACK)
+                self._draw_columns(lo, hi, 0, green_threshold, yellow_threshold, scale_factor, end=EDGE + 2)
+                self._surface.set_clip(None)
+        else:
+            return False
+        self._drawn_columns = self.columns
+        self._draw_key = key
+        return True
 
-        for i in range(len(self.data) - 1):
-            x1 = offset[0] + self.width - len(self.data) + i
-            x2 = x1 + 1
-            y1 = offset[1] + int(self.height - (self.data[i] * scale_factor / 3) * self.height)
-            y2 = offset[1] + int(self.height - (self.data[i+1] * scale_factor / 3) * self.height)
+    def draw_history(self, surface, lo, hi, green_threshold, yellow_threshold, offset):
+        # Draw a stretch of past (min, max) envelopes, e.g. from a Pyramid
+        # query, in place of the live trace; NaN columns had no data and
+        # the ones before the session started aren't drawn at all
+        hi = np.asarray(hi, dtype=float)[-self.width:]
+        seen = np.flatnonzero(~np.isnan(hi))
+        first = seen[0] if len(seen) else len(hi)
+        lo = np.nan_to_num(np.asarray(lo, dtype=float)[-self.width:][first:])
+        hi = np.nan_to_num(hi[first:])
+        if self._surface is None:
+            self._surface = pygame.Surface((self.width, self.height))
+        self._surface.fill(BLACK)
+        if len(hi):
+            peak = hi.max()
+            self._draw_columns(lo, hi, 0, green_threshold, yellow_threshold, 3 / peak if peak > 3 else 1)
+        # The live trace has to be rebuilt from scratch afterwards
+        self._draw_key = None
+        surface.blit(self._surface, offset)
+
+    def _draw_columns(self, lo, hi, start, green_threshold, yellow_threshold, scale_factor, end=None):
+        # Draw the segments leaving columns start..end-2 (end defaults to all
+        # n columns); each run of same-colored columns goes out as a single
+        # polyline zigzagging through min and max
+        n = len(hi)
+        end = n if end is None else min(end, n)
+        start = max(start, 0)
+        if end - 1 <= start:
+            return
 
-            if self.data[i] < green_threshold:
-                color = GREEN
-            elif self.data[i] < yellow_threshold:
-                color = YELLOW
-            else:
-                color = RED
+        xs = self.width - n + np.arange(n)
+        y_lo = (self.height - (lo * scale_factor / 3) * self.height).astype(int)
+        y_hi = (self.height - (hi * scale_factor / 3) * self.height).astype(int)
+        levels = (hi >= green_threshold).astype(int) + (hi >= yellow_threshold)
 
-            pygame.draw.line(surface, color, (x1, y1), (x2, y2), 2)
\ No newline at end of file
+        runs = [start, *(start + np.flatnonzero(np.diff(levels[start:end - 1])) + 1), end - 1]
+        for a, b in zip(runs[:-1], runs[1:]):
+            points = np.empty((2 * (b - a) + 1, 2), dtype=int)
+            points[0:-1:2, 0] = xs[a:b]
+            points[0:-1:2, 1] = y_lo[a:b]
+            points[1:-1:2, 0] = xs[a:b]
+            points[1:-1:2, 1] = y_hi[a:b]
+            points[-1] = xs[b], y_lo[b]
+            pygame.draw.lines(self._surface, COLORS[levels[a]], False, points.tolist(), 2)
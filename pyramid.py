@@ -0,0 +1,251 @@
+import json
+import math
+import os
+import struct
+import threading
+import numpy as np
+
+PYRAMID_MAGIC = b"MPKPYR01"
+BASE_WINDOW = 0.01  # s covered by one level-0 bucket
+FACTOR = 8  # buckets of a level that make up one bucket of the next
+
+# One cell per bucket and channel. The sum and count are kept instead of
+# the mean so cells can be merged as more samples land in them.
+LEVEL_DTYPE = np.dtype([('min', '<f4'), ('max', '<f4'), ('sum', '<f8'), ('count', '<u4')])
+
+def _empty(shape):
+    cells = np.empty(shape, dtype=LEVEL_DTYPE)
+    cells['min'] = np.inf
+    cells['max'] = -np.inf
+    cells['sum'] = 0
+    cells['count'] = 0
+    return cells
+
+def _reduce(idx, mins, maxs, sums, counts):
+    # Merge the rows that share an index; idx must be sorted
+    starts = np.flatnonzero(np.concatenate(([True], idx[1:] != idx[:-1])))
+    return (idx[starts], np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts),
+            np.add.reduceat(sums, starts), np.add.reduceat(counts, starts))
+
+class Pyramid:
+    # Min/max/mean of every channel over fixed time buckets: level 0 has one
+    # bucket per `base` seconds and each level above merges `factor` buckets
+    # of the one below, up to a single bucket for the whole session. Samples
+    # are added as they arrive and every level is updated with them, so a
+    # query never looks at raw samples: it picks the coarsest level that still
+    # has a bucket per pixel and reads at most `factor` cells per pixel.
+    # Times are seconds since `start`, the first sample's t unless given.
+    # A recorder's thread adds to it while the dashboard queries it, so both
+    # hold the pyramid's lock.
+    def __init__(self, channels=(), start=None, base=BASE_WINDOW, factor=FACTOR):
+        self.channels = []
+        self.start = start
+        self.base = base
+        self.factor = factor
+        self.levels = []  # (capacity, channels) LEVEL_DTYPE arrays
+        self.lengths = []  # buckets in use per level
+        self._columns = {}
+        self._lock = threading.Lock()
+        for channel in channels:
+            self._column(channel)
+
+    @property
+    def duration(self):
+        return self.lengths[0] * self.base if self.lengths else 0.0
+
+    def _column(self, channel):
+        column = self._columns.get(channel)
+        if column is None:
+            # A sensor that showed up mid-session gets a column of its own
+            column = len(self.channels)
+            for level, cells in enumerate(self.levels):
+                wider = _empty((len(cells), column + 1))
+                wider[:, :column] = cells
+                self.levels[level] = wider
+            self.channels.append(channel)
+            self._columns[channel] = column
+        return column
+
+    def add(self, channel, t, values):
+        # One channel's samples at times t (on the same clock as start)
+        t = np.asarray(t, dtype=float)
+        if not len(t):
+            return
+        with self._lock:
+            self._add(channel, t, values)
+
+    def _add(self, channel, t, values):
+        if self.start is None:
+            self.start = float(t[0])
+        column = self._column(channel)
+        buckets = ((t - self.start) // self.base).astype(np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        # Other channels' samples can land a read interval before the first
+        # one; anything before start has no bucket
+        keep = buckets >= 0
+        if not keep.all():
+            buckets, values = buckets[keep], values[keep]
+            if not len(buckets):
+                return
+        if np.any(buckets[1:] < buckets[:-1]):
+            order = np.argsort(buckets, kind='stable')
+            buckets, values = buckets[order], values[order]
+
+        cells = _reduce(buckets, values, values, values.astype(np.float64), np.ones(len(values), dtype=np.uint32))
+        for level in range(max(len(self.levels), 1)):
+            if level:
+                cells = _reduce(cells[0] // self.factor, *cells[1:])
+            self._merge(level, column, *cells)
+        # Grow new levels on top until one bucket covers everything
+        while self.lengths[-1] > 1:
+            self._add_level()
+
+    def _reserve(self, level, length):
+        if level == len(self.levels):
+            self.levels.append(_empty((0, len(self.channels))))
+            self.lengths.append(0)
+        cells = self.levels[level]
+        if len(cells) < length:
+            grown = _empty((max(length, 2 * len(cells)), len(self.channels)))
+            grown[:len(cells)] = cells
+            cells = self.levels[level] = grown
+        return cells
+
+    def _merge(self, level, column, idx, mins, maxs, sums, counts):
+        cells = self._reserve(level, int(idx[-1]) + 1)
+        cells['min'][idx, column] = np.minimum(cells['min'][idx, column], mins)
+        cells['max'][idx, column] = np.maximum(cells['max'][idx, column], maxs)
+        cells['sum'][idx, column] += sums
+        cells['count'][idx, column] += counts
+        self.lengths[level] = max(self.lengths[level], int(idx[-1]) + 1)
+
+    def _add_level(self):
+        below = self.levels[-1][:self.lengths[-1]]
+        length = -(-len(below) // self.factor)
+        padded = _empty((length * self.factor, len(self.channels)))
+        padded[:len(below)] = below
+        groups = padded.reshape(length, self.factor, len(self.channels))
+        cells = _empty((length, len(self.channels)))
+        cells['min'] = groups['min'].min(axis=1)
+        cells['max'] = groups['max'].max(axis=1)
+        cells['sum'] = groups['sum'].sum(axis=1)
+        cells['count'] = groups['count'].sum(axis=1)
+        self.levels.append(cells)
+        self.lengths.append(length)
+
+    def query(self, start, end, width, channels=None):
+        # min, max and mean of each channel over `width` equal slices of
+        # start..end (session seconds), as (points, channels) arrays with NaN
+        # where there was no data. Slices never get finer than a level-0
+        # bucket, so a zoomed-in range comes back with fewer points. The ends
+        # of the range are exact to a level-0 bucket; slice edges inside it
+        # are only as exact as the level's buckets, which are no wider than
+        # a slice.
+        if width < 1 or not end > start:
+            raise ValueError("Need a positive width and end > start")
+        channels = list(self.channels if channels is None else channels)
+        try:
+            columns = [self._columns[channel] for channel in channels]
+        except KeyError as e:
+            raise ValueError(f"Unknown channel: {e.args[0]}")
+
+        with self._lock:
+            return self._query(start, end, width, channels, columns)
+
+    def _query(self, start, end, width, channels, columns):
+        span = (end - start) / width
+        level = 0
+        while level + 1 < len(self.levels) and self.base * self.factor ** (level + 1) <= span:
+            level += 1
+        bucket = self.base * self.factor ** level
+        dt = max(span, bucket)
+        points = max(1, math.ceil((end - start) / dt - 1e-9))
+
+        result = {
+            "start": start, "dt": dt, "level": level, "channels": channels,
+            "min": np.full((points, len(columns)), np.nan, dtype=np.float32),
+            "max": np.full((points, len(columns)), np.nan, dtype=np.float32),
+            "mean": np.full((points, len(columns)), np.nan, dtype=np.float32),
+        }
+        if not self.levels:
+            return result
+        times, cells = self._cover(level, start, end, columns)
+        if not len(cells):
+            return result
+
+        # The 1e-6 keeps a bucket that starts right on a pixel edge from rounding into the pixel before
+        pixels = np.floor((np.maximum(times, start) - start) / dt + 1e-6)
+        pixels = np.clip(pixels, 0, points - 1).astype(np.int64)
+        idx, mins, maxs, sums, counts = _reduce(pixels, cells['min'], cells['max'], cells['sum'], cells['count'])
+        filled = counts > 0
+        result["min"][idx] = np.where(filled, mins, np.nan)
+        result["max"][idx] = np.where(filled, maxs, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result["mean"][idx] = np.where(filled, sums / counts, np.nan)
+        return result
+
+    def _cover(self, level, start, end, columns):
+        # (start times, cells) of the buckets covering start..end: whole
+        # buckets of `level` in the middle, and the two ends from finer and
+        # finer levels, so a coarse bucket that only partly overlaps the range
+        # never brings in samples from outside it. Only level 0 is cut at its
+        # own bucket, at most `factor` cells per level are read per end, and
+        # only these rows are read, which for a memory-mapped index means
+        # only these pages.
+        bucket = self.base * self.factor ** level
+        if level:
+            first = math.ceil(start / bucket - 1e-6)
+            last = math.floor(end / bucket + 1e-6)
+        else:
+            first = math.floor(start / bucket + 1e-6)
+            last = math.ceil(end / bucket - 1e-6)
+        first, last = max(first, 0), min(last, self.lengths[level])
+        if last <= first:
+            return self._cover(level - 1, start, end, columns) if level and end > start else (np.empty(0), _empty((0, len(columns))))
+        parts = [(np.arange(first, last) * bucket, self.levels[level][first:last][:, columns])]
+        if level and start < first * bucket:
+            parts.insert(0, self._cover(level - 1, start, first * bucket, columns))
+        if level and last * bucket < end:
+            parts.append(self._cover(level - 1, last * bucket, end, columns))
+        return np.concatenate([times for times, _ in parts]), np.concatenate([cells for _, cells in parts])
+
+    def save(self, path):
+        # MAGIC, a little-endian uint32 length and a JSON header padded to
+        # 8 bytes, then every level's cells, level 0 first
+        header = {
+            "version": 1,
+            "start": self.start,
+            "base": self.base,
+            "factor": self.factor,
+            "channels": self.channels,
+            "lengths": self.lengths,
+        }
+        body = json.dumps(header).encode('utf-8')
+        body += b" " * (-(len(PYRAMID_MAGIC) + 4 + len(body)) % 8)
+        # Written aside and renamed, so a reader never sees half an index
+        partial = path + ".partial"
+        with open(partial, 'wb') as file:
+            file.write(PYRAMID_MAGIC + struct.pack("<I", len(body)) + body)
+            for cells, length in zip(self.levels, self.lengths):
+                file.write(np.ascontiguousarray(cells[:length]).tobytes())
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        # Memory-maps a saved index; it can be queried but not added to
+        with open(path, 'rb') as file:
+            if file.read(len(PYRAMID_MAGIC)) != PYRAMID_MAGIC:
+                raise ValueError("Not a pyramid index")
+            length, = struct.unpack("<I", file.read(4))
+            header = json.loads(file.read(length))
+        pyramid = cls(header["channels"], header["start"], header["base"], header["factor"])
+        offset = len(PYRAMID_MAGIC) + 4 + length
+        for length in header["lengths"]:
+            shape = (length, len(pyramid.channels))
+            if length:
+                pyramid.levels.append(np.memmap(path, dtype=LEVEL_DTYPE, mode='r', offset=offset, shape=shape))
+            else:
+                pyramid.levels.append(_empty(shape))
+            pyramid.lengths.append(length)
+            offset += length * len(pyramid.channels) * LEVEL_DTYPE.itemsize
+        return pyramid
@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+from impact import resultant
+from pyramid import Pyramid
+
+MAGIC = b"MPKREC01"
+
+# One fixed-width record per sample, all sensors interleaved in arrival order
+FIELD_TYPES = {'port': '<u4', 't': '<f8', 'device_t': '<f8', 'x': '<f4', 'y': '<f4', 'z': '<f4'}
+RECORD_DTYPE = np.dtype([(name, FIELD_TYPES[name]) for name in ('port', 't', 'device_t', 'x', 'y', 'z')])
+SAMPLE_FIELDS = RECORD_DTYPE.names[1:]
+
+INDEX_CHUNK = 1 << 20  # records per pass when indexing a recording
+HEADER_SPACE = 16384  # bytes a recorder reserves for its header, so sensors added later still fit
+
+def sensor_entry(sensor):
+    return {"port": sensor.port, "device": sensor.device, "column": sensor.column}
+
+def write_header(file, sensors, started=None, space=0):
+    # MAGIC, a little-endian uint32 length, then a JSON description of the
+    # session padded so the records start on an 8-byte boundary, or padded
+    # out to `space` bytes in all so it can be rewritten in place later.
+    # sensors are Sensors or their sensor_entry() dicts.
+    header = {
+        "version": 2,
+        "started": started or time.time(),
+        "fields": list(RECORD_DTYPE.names),
+        "record_size": RECORD_DTYPE.itemsize,
+        "sensors": [sensor if isinstance(sensor, dict) else sensor_entry(sensor) for sensor in sensors],
+    }
+    body = json.dumps(header).encode('utf-8')
+    if space:
+        if len(MAGIC) + 4 + len(body) > space:
+            raise ValueError("Too many sensors for the recording header")
+        body += b" " * (space - len(MAGIC) - 4 - len(body))
+    body += b" " * (-(len(MAGIC) + 4 + len(body)) % 8)
+    file.write(MAGIC + struct.pack("<I", len(body)) + body)
+
+def read_header(file):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a sensor recording")
+    length, = struct.unpack("<I", file.read(4))
+    return json.loads(file.read(length)), len(MAGIC) + 4 + length
+
+class SessionRecorder:
+    # Appends every sample to a recording. The ingest side only queues the
+    # batches it already parsed; a background thread converts and writes them
+    # through a large file buffer, so recording never slows acquisition down.
+    # The same thread keeps a Pyramid of each port's magnitude up to date,
+    # queryable while recording and saved beside the file on close. Sensors
+    # plugged in mid-session are added to the header, which has room for them.
+    # Reader threads may still submit while it closes; anything after close()
+    # is dropped rather than queued behind the writer's stop.
+    def __init__(self, path, sensors):
+        self.path = path
+        self.file = open(path, 'wb', buffering=1 << 20)
+        self.sensors = [sensor_entry(sensor) for sensor in sensors]
+        self.started = time.time()
+        write_header(self.file, self.sensors, self.started, HEADER_SPACE)
+        self.records_written = 0
+        self.index = Pyramid([sensor.port for sensor in sensors])
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name="recorder", daemon=True)
+        self._thread.start()
+
+    def submit(self, port, samples):
+        with self._lock:
+            if not self._closed:
+                self._queue.put((port, samples))
+
+    def add_sensor(self, sensor):
+        # Goes through the writer thread like the samples, so the header is
+        # never rewritten in the middle of a record
+        with self._lock:
+            if not self._closed:
+                self._queue.put((None, sensor_entry(sensor)))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            port, samples = item
+            if port is None:
+                self.sensors.append(samples)
+                end = self.file.tell()
+                self.file.seek(0)
+                write_header(self.file, self.sensors, self.started, HEADER_SPACE)
+                self.file.seek(end)
+                continue
+            records = np.empty(len(samples), dtype=RECORD_DTYPE)
+            records['port'] = port
+            for name in SAMPLE_FIELDS:
+                records[name] = samples[name]
+            self.file.write(records.tobytes())
+            self.records_written += len(records)
+            self.index.add(port, samples['t'], resultant(samples))
+        self.file.close()
+        self.index.save(index_path(self.path))
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+class SessionReplay:
+    # Memory-maps a recording, so opening an hour-long session is instant and
+    # samples are sliced straight out of the page cache without copying the file
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        with open(path, 'rb') as file:
+            self.header, offset = read_header(file)
+        # Version 1 files have no device_t column
+        dtype = np.dtype([(name, FIELD_TYPES[name]) for name in self.header["fields"]])
+        self.records = np.memmap(path, dtype=dtype, mode='r', offset=offset)
+        self.sensors = self.header["sensors"]
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, sensors):
+        # sensors: the Sensor objects to feed, matched on port
+        self._targets = {sensor.port: sensor for sensor in sensors}
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._play, name="replay", daemon=True)
+        self._thread.start()
+
+    def _play(self):
+        # Sensors' batches are interleaved in arrival order, so t jumps back
+        # and forth between them. Each record is released once the session
+        # clock passes it and every record before it: the running max is
+        # monotonic, which searchsorted needs, and every sensor still gets its
+        # samples in order, none skipped or repeated.
+        times = np.maximum.accumulate(self.records['t'])
+        if not len(times):
+            return
+        while not self._stop.is_set():
+            first = times[0]
+            started = time.monotonic()
+            position = 0
+            while position < len(times) and not self._stop.is_set():
+                # Everything recorded up to "now" on the session clock
+                now = time.monotonic()
+                end = np.searchsorted(times, first + (now - started) * self.speed, side='right')
+                if end > position:
+                    self._deliver(self.records[position:end], first, started)
+                    position = end
+                self._stop.wait(0.005)
+            if not self.loop:
+                break
+
+    def _deliver(self, chunk, first, started):
+        for port, sensor in self._targets.items():
+            mine = chunk[chunk['port'] == port]
+            if not len(mine):
+                continue
+            samples = np.empty(len(mine), dtype=sensor.ring.slots.dtype)
+            # Shift the recorded clock onto this process's monotonic clock
+            samples['t'] = started + (mine['t'] - first) / self.speed
+            # Device time is scaled with it so the fusion clock fit still sees a steady rate
+            samples['device_t'] = mine['device_t'] / self.speed if 'device_t' in mine.dtype.names else np.nan
+            samples['x'] = mine['x']
+            samples['y'] = mine['y']
+            samples['z'] = mine['z']
+            sensor.ring.extend(samples)
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+def index_path(path):
+    return path + ".pyr"
+
+def build_index(path):
+    # Pyramid of a recording made without one (or an event capture), read
+    # through in chunks so an hour-long file never has to fit in memory
+    replay = SessionReplay(path)
+    records = replay.records
+    start = float(records['t'][:INDEX_CHUNK].min()) if len(records) else None
+    pyramid = Pyramid([sensor["port"] for sensor in replay.sensors], start)
+    for offset in range(0, len(records), INDEX_CHUNK):
+        chunk = records[offset:offset + INDEX_CHUNK]
+        for port in np.unique(chunk['port']):
+            mine = chunk[chunk['port'] == port]
+            pyramid.add(int(port), mine['t'], resultant(mine))
+    return pyramid
+
+def open_index(path):
+    # The saved index of a recording, built (and saved if possible) when it
+    # is missing or older than the recording
+    saved = index_path(path)
+    if os.path.exists(saved) and os.path.getmtime(saved) >= os.path.getmtime(path):
+        return Pyramid.load(saved)
+    pyramid = build_index(path)
+    try:
+        pyramid.save(saved)
+    except OSError:
+        pass
+    return pyramid
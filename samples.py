@@ -0,0 +1,81 @@
+import threading
+import numpy as np
+
+RING_CAPACITY = 8192  # samples kept per sensor (~8 s at 1 kHz)
+
+# t is the host's time.monotonic() when the sample was read, device_t the
+# board's own rtcDate/rtcTime in seconds since the epoch (NaN if unknown)
+SAMPLE_DTYPE = np.dtype([('t', 'f8'), ('device_t', 'f8'), ('x', 'f8'), ('y', 'f8'), ('z', 'f8')])
+
+class DataSignal:
+    # A generation number that writers bump whenever they add samples and
+    # readers block on, so a consumer can sleep until there is something new
+    # instead of polling on a timer
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.generation = 0
+
+    def notify(self):
+        with self._condition:
+            self.generation += 1
+            self._condition.notify_all()
+
+    def wait(self, seen, timeout=None):
+        # Blocks until the generation moves on from `seen` or timeout runs
+        # out; returns the current generation
+        with self._condition:
+            self._condition.wait_for(lambda: self.generation != seen, timeout)
+            return self.generation
+
+# Bumped by the sensors' rings in this process; rings another process
+# writes (the ingest daemon's) can't signal it, so shared-mode readers have
+# to poll
+NEW_SAMPLES = DataSignal()
+
+class SampleRing:
+    # Fixed-size ring of SAMPLE_DTYPE records. Each sensor's reader is the only
+    # writer, so readers never take a lock: they look at `count`, copy the slots
+    # they want and then drop anything the writer lapped meanwhile. signal is
+    # the DataSignal to bump on every write, for rings outputs wait on.
+    signal = None
+
+    def __init__(self, capacity=RING_CAPACITY, signal=None):
+        self.capacity = capacity
+        self.slots = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.count = 0  # total samples ever written
+        self.signal = signal
+
+    def extend(self, samples):
+        # Only the last lap of an oversized batch can survive anyway
+        self.count += max(0, len(samples) - self.capacity)
+        samples = samples[-self.capacity:]
+        start = self.count % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self.slots[start:start + first] = samples[:first]
+        self.slots[:len(samples) - first] = samples[first:]
+        self.count += len(samples)
+        if self.signal:
+            self.signal.notify()
+
+    def latest(self):
+        count = self.count
+        if count == 0:
+            return None
+        return self.slots[(count - 1) % self.capacity].copy()
+
+    def read_since(self, seq):
+        # Returns (samples, next_seq, dropped) for everything written since `seq`
+        end = self.count
+        start = max(seq, end - self.capacity)
+        samples = np.take(self.slots, np.arange(start, end) % self.capacity)
+        # Anything older than one lap behind the writer may have been overwritten
+        # while we were copying it
+        overwritten = self.count - self.capacity - start
+        if overwritten > 0:
+            samples = samples[overwritten:]
+            start += overwritten
+        return samples, end, start - seq
+
+    def window(self, n):
+        samples, _, _ = self.read_since(max(0, self.count - n))
+        return samples
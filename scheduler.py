@@ -0,0 +1,50 @@
+import time
+from samples import NEW_SAMPLES
+
+class Pacer:
+    # Paces one output (the display, the web stream) by the data instead of a
+    # fixed timer: wait() returns as soon as new samples arrive, but never
+    # sooner than `interval` after the previous return, so whatever lands in
+    # between goes out as one batch. With nothing new it sleeps for up to
+    # `idle` seconds. The fused grid runs LATENCY_MARGIN behind the samples,
+    # so it keeps returning at `interval` for `linger` seconds after the last
+    # sample to let the final ticks out. With `poll` set (the samples come
+    # from another process, which can't signal this one) it wakes that often
+    # and treats every wake as new data.
+    def __init__(self, interval, idle=1.0, linger=0.0, poll=None, signal=NEW_SAMPLES):
+        self.interval = interval
+        self.idle = idle
+        self.linger = linger
+        self.poll = poll
+        self.signal = signal
+        self._seen = signal.generation
+        self._next = 0.0
+        self._linger_until = 0.0
+
+    def wait(self, stop=None):
+        # True when there may be new samples, False on an idle wake-up; stop
+        # is an optional threading.Event that cuts the wait short
+        now = time.monotonic()
+        if now < self._next:
+            if stop:
+                stop.wait(self._next - now)
+            else:
+                time.sleep(self._next - now)
+            now = time.monotonic()
+        if stop and stop.is_set():
+            return False
+
+        if self.poll is not None:
+            timeout = self.poll
+        elif now < self._linger_until:
+            timeout = 0
+        else:
+            timeout = self.idle
+        generation = self.signal.wait(self._seen, timeout)
+        now = time.monotonic()
+        fresh = generation != self._seen
+        if fresh:
+            self._linger_until = now + self.linger
+        self._seen = generation
+        self._next = now + self.interval
+        return fresh or self.poll is not None or now < self._linger_until
@@ -1,98 +1,614 @@
+import calendar
+import functools
+import io
 import math
+import os
+import selectors
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import serial
+from recording import SessionRecorder, SessionReplay
+from transports import Transport, SerialTransport
+from impact import ImpactMonitor
+from capture import EventCapture
+from fusion import FUSION_RATE, LATENCY_MARGIN, FusionStage
+from calibration import ZERO_SECONDS, Calibration
+from pyramid import Pyramid
+from spectrum import SpectrumEngine
+from scheduler import Pacer
+from samples import NEW_SAMPLES, SAMPLE_DTYPE, SampleRing
+from shared_stream import STREAM_NAME, SharedStream
+from discovery import PortSupervisor, discover
+from metrics import REGISTRY
+
+BAUD_RATE = 115200
+MAX_SENSORS = 64  # a few USB hubs' worth
+NEUTRAL = "neutral"  # the column of sensors that aren't summed into any group
+DEFAULT_GROUPS = ("external", "internal")
+MAX_SPREAD = 1.0  # s a batch's timestamps may reach back, the serial read timeout
+
+def configured_groups(groups=None):
+    # Group names as given, else from MACPARKMAN_GROUPS (comma-separated),
+    # else DEFAULT_GROUPS; the ingest daemon and its clients read the same
+    # variable so their columns line up
+    groups = groups or os.environ.get("MACPARKMAN_GROUPS", ",".join(DEFAULT_GROUPS)).split(",")
+    return tuple(group.strip() for group in groups if group.strip() and group.strip() != NEUTRAL)
+
+DEFAULT_THRESHOLDS = (1.0, 2.0)  # g; green and yellow level of every group
+
+def configured_thresholds(groups, thresholds=None):
+    # {group: [green, yellow]} from thresholds as given, else from
+    # MACPARKMAN_THRESHOLDS: "green:yellow" for every group, or per group as
+    # "external=1:2,internal=1.5:3"; groups not named get DEFAULT_THRESHOLDS
+    thresholds = thresholds or os.environ.get("MACPARKMAN_THRESHOLDS", "")
+    levels = {group: list(DEFAULT_THRESHOLDS) for group in groups}
+    for entry in filter(None, (entry.strip() for entry in thresholds.split(","))):
+        group, _, pair = entry.rpartition("=")
+        green, yellow = (float(level) for level in pair.split(":"))
+        if green > yellow:
+            raise ValueError(f"Green threshold above yellow in {entry!r}")
+        for name in [group.strip()] if group else groups:
+            if name in levels:
+                levels[name] = [green, yellow]
+    return levels
+
+LINE_DTYPE = np.dtype([('date', 'S10'), ('time', 'S12'), ('x', 'f8'), ('y', 'f8'), ('z', 'f8')])
+
+@functools.lru_cache(maxsize=64)
+def device_day(date):
+    # Days since the epoch for an rtcDate, NaN if it isn't one
+    try:
+        return calendar.timegm(time.strptime(date.decode(), "%m/%d/%Y")) // 86400
+    except (ValueError, UnicodeDecodeError):
+        return np.nan
+
+def parse_device_times(dates, times):
+    # Artemis rtcDate/rtcTime ("MM/DD/YYYY", "HH:MM:SS.ss") to seconds since the
+    # epoch, NaN where a field doesn't look like that. Digits are read straight
+    # from the bytes rather than going through float().
+    times = np.ascontiguousarray(times, dtype='S12')
+    digits = times.view('u1').reshape(len(times), 12).astype(np.int32) - ord('0')
+    valid = (digits[:, 2] == ord(':') - ord('0')) & (digits[:, 5] == ord(':') - ord('0')) & (digits[:, 8] == ord('.') - ord('0'))
+    clock = (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60 + digits[:, 6] * 10 + digits[:, 7]
+    fraction = digits[:, 9:]
+    is_digit = (fraction >= 0) & (fraction <= 9)
+    clock = clock + np.where(is_digit, fraction, 0) @ (10.0 ** -np.arange(1, 4))
+    # Usually a single date per batch, so look up each distinct one only once
+    if (dates == dates[0]).all():
+        days = device_day(bytes(dates[0]))
+    else:
+        days = np.full(len(dates), np.nan)
+        for date in np.unique(dates):
+            days[dates == date] = device_day(bytes(date))
+    return np.where(valid, days * 86400 + clock, np.nan)
+
+def parse_lines(chunk, timestamp):
+    # Parse a buffer of complete Artemis CSV lines ("date,time,x,y,z,...") in one
+    # go. Returns (samples, malformed) where samples is a SAMPLE_DTYPE array.
+    try:
+        lines = np.loadtxt(io.BytesIO(chunk), delimiter=',', usecols=(0, 1, 2, 3, 4), dtype=LINE_DTYPE, ndmin=1)
+        malformed = 0
+    except ValueError:
+        # At least one bad line: fall back to line by line so we keep the good ones
+        rows = []
+        malformed = 0
+        for line in chunk.split(b"\n"):
+            if not line.strip():
+                continue
+            parts = line.split(b",")
+            try:
+                rows.append((parts[0].strip(), parts[1].strip(), float(parts[2]), float(parts[3]), float(parts[4])))
+            except (ValueError, IndexError):
+                malformed += 1
+        lines = np.array(rows, dtype=LINE_DTYPE)
+    samples = np.empty(len(lines), dtype=SAMPLE_DTYPE)
+    samples['t'] = timestamp
+    samples['device_t'] = parse_device_times(lines['date'], lines['time']) if len(lines) else 0
+    samples['x'] = lines['x']
+    samples['y'] = lines['y']
+    samples['z'] = lines['z']
+    return samples, malformed
 
 class Sensor:
-    def __init__(self, port):
+    # transport defaults to the serial port named by device (COM<port>).
+    # Slots keep dozens of these small and their attribute reads quick.
+    __slots__ = ("port", "device", "transport", "connected", "active", "x", "y", "z", "column", "ring",
+                 "malformed_lines", "last_error", "recorder", "_buffer", "_last_read", "_period", "_reader", "_stop",
+                 "_lines", "_parse_errors", "_bytes", "_read_seconds", "_disconnects")
+
+    def __init__(self, port, device=None, transport=None):
         self.port = port
-        self.ser = None
+        self.device = device or (transport.name if transport else f"COM{port}")
+        self.transport = transport
         self.connected = False
         self.active = False
         self.x = 0
         self.y = 0
         self.z = 0
-        self.column = "neutral"
+        self.column = NEUTRAL
+        self.ring = SampleRing(signal=NEW_SAMPLES)  # replay writes here too
+        self.malformed_lines = 0
+        self.last_error = None
+        self.recorder = None
+        self._buffer = b""
+        self._last_read = None
+        self._period = None  # s between the board's lines, averaged over reads
+        self._reader = None
+        self._stop = threading.Event()
+        self._lines = REGISTRY.counter("macparkman_lines_total", "Lines parsed into samples", port=port)
+        self._parse_errors = REGISTRY.counter("macparkman_parse_errors_total", "Lines that could not be parsed", port=port)
+        self._bytes = REGISTRY.counter("macparkman_bytes_read_total", "Bytes read from the transport", port=port)
+        self._read_seconds = REGISTRY.histogram("macparkman_read_seconds", "Time spent in one transport read call", port=port)
+        self._disconnects = REGISTRY.counter("macparkman_disconnects_total", "Times the transport failed or ended", port=port)
 
-    def connect(self):
+    def connect(self, start_reader=True):
         try:
-            self.ser = serial.Serial(f"COM{self.port}", 115200, timeout=1)
+            if self.transport is None:
+                self.transport = SerialTransport(self.device, BAUD_RATE)
+            self.transport.open()
             self.connected = True
             self.active = True # TODO: Change active and column!!!
-            self.column = "external"
-        except serial.SerialException:
+            if start_reader:
+                self.start_reader()
+        except (serial.SerialException, OSError) as e:
+            self.last_error = repr(e)
             self.connected = False
 
-    def read_data(self):
-        if self.connected and self.ser:
+    def start_reader(self):
+        if self._reader is None and self.connected:
+            self._stop.clear()
+            self._reader = threading.Thread(target=self._read_loop, name=f"COM{self.port} reader", daemon=True)
+            self._reader.start()
+
+    def _read_loop(self):
+        # Drain the port continuously so nothing piles up in the OS buffer;
+        # the blocking read only ever stalls this thread, never the UI
+        while not self._stop.is_set():
+            started = time.perf_counter()
             try:
-                line = self.ser.readline().decode('utf-8').strip()
-                if line:
-                    # print(f"COM{self.port} raw data: '{line}'and {self.active}") # TODO: Delete
-                    parts = line.split(',')
-                    if len(parts) >= 5:
-                        self.x = float(parts[2])
-                        self.y = float(parts[3])
-                        self.z = float(parts[4])
-                        return True
-            except (ValueError, TypeError, serial.SerialException):
-                pass
-        return False
+                data = self.transport.read()
+            except (serial.SerialException, OSError, TypeError, EOFError) as e:
+                self.disconnected(e)
+                break
+            self._read_seconds.observe(time.perf_counter() - started)
+            if data:
+                self.feed(data)
+
+    def disconnected(self, error):
+        # Keep the reason around for the overlay instead of dropping it silently
+        self.last_error = repr(error)
+        self._disconnects.inc()
+        self.connected = False
+
+    def feed(self, data):
+        # Parse every complete line in one batch, keeping any partial tail for next time
+        self._bytes.inc(len(data))
+        self._buffer += data
+        cut = self._buffer.rfind(b"\n") + 1
+        if not cut:
+            return
+        chunk, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        now = time.monotonic()
+        samples, malformed = parse_lines(chunk, now)
+        self.malformed_lines += malformed
+        self._parse_errors.inc(malformed)
+        self._lines.inc(len(samples))
+        if len(samples) and self._last_read is not None:
+            # The lines arrived spread over the time since the previous read, so
+            # spread their timestamps too instead of stamping the whole batch with
+            # now. After a silence they only go back as far as the board's line
+            # period allows, never across the silence, and the last is now.
+            gap = now - self._last_read
+            if gap < MAX_SPREAD:
+                period = gap / len(samples)
+                self._period = period if self._period is None else 0.9 * self._period + 0.1 * period
+            spread = min(gap, MAX_SPREAD, len(samples) * self._period if self._period else gap)
+            samples['t'] = np.linspace(now - spread, now, len(samples) + 1)[1:]
+        self._last_read = now
+        if len(samples):
+            self.ring.extend(samples)
+            # Read once: stop_recording can clear it from another thread
+            recorder = self.recorder
+            if recorder:
+                recorder.submit(self.port, samples)
+
+    def read_data(self):
+        # Pick up the newest sample from the ring; never touches the port
+        sample = self.ring.latest()
+        if sample is None:
+            return False
+        self.x, self.y, self.z = float(sample['x']), float(sample['y']), float(sample['z'])
+        return True
 
     def close(self):
-        if self.ser:
-            self.ser.close()
+        self._stop.set()
+        if self._reader:
+            self._reader.join(timeout=2)
+            self._reader = None
+        if self.transport:
+            self.transport.close()
+        self._buffer = b""
+        self._last_read = None
+        self._period = None
 
-class SensorManager:
+class SelectorIngest:
+    # Alternative to one reader thread per port: a single thread waits on every
+    # open port with a selector and reads whatever bytes each ready port has.
+    # Sensor.feed keeps partial lines between reads. POSIX only, since Windows
+    # cannot select() on COM handles.
     def __init__(self):
-        self.sensors = [Sensor(i) for i in range(1, 9)]
-        self.total_x_external = 0
-        self.total_y_external = 0
-        self.total_z_external = 0
-        self.total_x_internal = 0
-        self.total_y_internal = 0
-        self.total_z_internal = 0
+        self.selector = selectors.DefaultSelector()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add(self, sensor):
+        self.selector.register(sensor.transport.fileno(), selectors.EVENT_READ, sensor)
+
+    def remove(self, sensor):
+        # By sensor rather than fileno(), which a dead port may not have any more
+        for key in list(self.selector.get_map().values()):
+            if key.data is sensor:
+                self.selector.unregister(key.fd)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="selector ingest", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.selector.get_map():
+                self._stop.wait(0.1)
+                continue
+            for key, _ in self.selector.select(timeout=0.1):
+                sensor = key.data
+                started = time.perf_counter()
+                try:
+                    data = os.read(key.fd, 65536)
+                    error = EOFError(sensor.device)
+                except OSError as e:
+                    data = b""
+                    error = e
+                sensor._read_seconds.observe(time.perf_counter() - started)
+                if data:
+                    sensor.feed(data)
+                else:
+                    # EOF or a vanished device
+                    self.selector.unregister(key.fd)
+                    sensor.disconnected(error)
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.selector.close()
+
+class SensorManager:
+    # ingest_mode "shared" makes this a client of the ingest daemon: the
+    # sensors are stand-ins whose rings are the daemon's shared ones
+    def __init__(self, ingest_mode="threads", devices=None, replay=None, stream=None, groups=DEFAULT_GROUPS):
+        if ingest_mode not in ("threads", "selector", "shared"):
+            raise ValueError(f"Unknown ingest mode: {ingest_mode}")
+        if ingest_mode == "shared" and replay:
+            raise ValueError("Replay from the ingest daemon (--replay) in shared mode")
+        self.ingest_mode = ingest_mode
+        self.replay = replay
+        # Named columns sensors can be summed into, e.g. skull, brain, neck
+        self.groups = tuple(groups)
+        self.recorder = None
+        self.stream = stream or (SharedStream.attach() if ingest_mode == "shared" else None)
+        if self.stream:
+            self.sensors = [Sensor(port, device) for port, device in self.stream.sensor_info()]
+            for sensor, ring in zip(self.sensors, self.stream.rings):
+                sensor.ring = ring
+        elif replay:
+            self.sensors = [Sensor(info["port"], info["device"]) for info in replay.sensors]
+        elif devices is not None:
+            # Device names or ready-made Transport objects, numbered from 1
+            self.sensors = [
+                Sensor(i, transport=device) if isinstance(device, Transport) else Sensor(i, device)
+                for i, device in enumerate(devices, start=1)
+            ]
+        else:
+            self.sensors = []  # filled in by discovery in connect_sensors
+        self.discover = devices is None and not (self.stream or replay)
+        self.supervisor = None
+        self._lock = threading.Lock()
+        self.selector_ingest = SelectorIngest() if ingest_mode == "selector" else None
+        self._cursors = {}
+        self._first_seq = {}
+        self.dropped_samples = 0
+        REGISTRY.add_collector(self.collect_metrics)
 
     def connect_sensors(self):
-        for sensor in self.sensors:
+        if self.stream:
+            # Attaching to a daemon that has been running for a while starts at
+            # the live edge rather than replaying its whole backlog
+            self.stream.refresh(self.sensors)
+            self._first_seq = {sensor.port: sensor.ring.count for sensor in self.sensors}
+            return
+        if self.replay:
+            # Recorded sensors come back exactly as they were set up
+            for sensor, info in zip(self.sensors, self.replay.sensors):
+                sensor.connected = True
+                sensor.active = True
+                sensor.column = info["column"]
+            self.replay.start(self.sensors)
+            return
+        if self.discover:
+            found = discover()
+            for transport in found[MAX_SENSORS:]:
+                transport.close()
+            self.sensors = [Sensor(i, transport=transport) for i, transport in enumerate(found[:MAX_SENSORS], start=1)]
+        # Opening a port can take a while, so open them all at once
+        if self.sensors:
+            with ThreadPoolExecutor(max_workers=len(self.sensors), thread_name_prefix="connect") as pool:
+                list(pool.map(self._connect, self.sensors))
+        if self.selector_ingest:
+            self.selector_ingest.start()
+        self.supervisor = PortSupervisor(self, scan=self.discover)
+        self.supervisor.start()
+
+    def _connect(self, sensor):
+        if self.selector_ingest:
+            sensor.connect(start_reader=False)
+            if sensor.connected:
+                self.selector_ingest.add(sensor)
+        else:
             sensor.connect()
+        if sensor.connected:
+            sensor.column = self.groups[0]
+
+    def reconnect(self, sensor, transport=None):
+        # Called from the supervisor's pool once a sensor dropped out; the
+        # sensor keeps its ring, column and active flag across the reconnect.
+        # transport is the same board found under a new device name.
+        column, active = sensor.column, sensor.active
+        if self.selector_ingest:
+            self.selector_ingest.remove(sensor)
+        sensor.close()
+        if transport:
+            sensor.transport, sensor.device = transport, transport.name
+        self._connect(sensor)
+        if sensor.connected:
+            sensor.column, sensor.active = column, active
+        return sensor.connected
+
+    def add_sensor(self, transport):
+        # A board plugged in mid-session. self.sensors is replaced rather than
+        # appended to, so loops over the old list never see it change.
+        with self._lock:
+            if len(self.sensors) >= MAX_SENSORS:
+                transport.close()
+                return None
+            sensor = Sensor(max((s.port for s in self.sensors), default=0) + 1, transport=transport)
+            sensor.recorder = self.recorder
+            self._connect(sensor)
+            if self.recorder:
+                self.recorder.add_sensor(sensor)
+            self.sensors = self.sensors + [sensor]
+            return sensor
 
     def update_sensors(self):
-        self.total_x_external = 0
-        self.total_y_external = 0
-        self.total_z_external = 0
-        self.total_x_internal = 0
-        self.total_y_internal = 0
-        self.total_z_internal = 0
+        if self.stream:
+            self.stream.refresh(self.sensors)
+
+        # Each sensor's newest raw reading; calibration is applied once, to
+        # the sample batches in LogicHandler.process_samples
+        for sensor in self.sensors:
+            if sensor.active:
+                sensor.read_data()
 
+    def collect_new_samples(self, consumer="default"):
+        # Every sample each sensor has read since this consumer's previous call,
+        # as one SAMPLE_DTYPE batch per sensor. A slow consumer still sees all of
+        # them as long as it keeps within RING_CAPACITY
+        batches = {}
         for sensor in self.sensors:
-            if sensor.active and sensor.read_data():
-                if sensor.column == "external":
-                    self.total_x_external += sensor.x
-                    self.total_y_external += sensor.y
-                    self.total_z_external += sensor.z
-                elif sensor.column == "internal":
-                    self.total_x_internal += sensor.x
-                    self.total_y_internal += sensor.y
-                    self.total_z_internal += sensor.z
+            key = (consumer, sensor.port)
+            samples, self._cursors[key], dropped = sensor.ring.read_since(self._cursors.get(key, self._first_seq.get(sensor.port, 0)))
+            if dropped:
+                self.dropped_samples += dropped
+                REGISTRY.counter("macparkman_dropped_samples_total", "Samples overwritten before a consumer read them", port=sensor.port, consumer=consumer).inc(dropped)
+            if len(samples):
+                batches[sensor] = samples
+        return batches
+
+    def collect_metrics(self):
+        # Gauges that are cheaper to work out when someone looks at them
+        for sensor in self.sensors:
+            REGISTRY.gauge("macparkman_connected", "1 while the sensor's transport is up", port=sensor.port).set(int(sensor.connected))
+            dropped_lines = getattr(sensor.transport, "dropped_lines", None)
+            if dropped_lines is not None:
+                REGISTRY.gauge("macparkman_device_dropped_lines", "Lines the device side lost to overruns", port=sensor.port).set(dropped_lines)
+        for (consumer, port), cursor in list(self._cursors.items()):
+            sensor = next((sensor for sensor in self.sensors if sensor.port == port), None)
+            if sensor:
+                REGISTRY.gauge("macparkman_ring_backlog", "Samples in the ring the consumer has not read yet", port=port, consumer=consumer).set(max(0, sensor.ring.count - cursor))
+
+    def start_recording(self, path):
+        if self.stream:
+            raise ValueError("Record from the ingest daemon (--record) in shared mode")
+        self.stop_recording()
+        self.recorder = SessionRecorder(path, self.sensors)
+        for sensor in self.sensors:
+            sensor.recorder = self.recorder
+
+    def stop_recording(self):
+        if self.recorder:
+            for sensor in self.sensors:
+                sensor.recorder = None
+            self.recorder.close()
+            self.recorder = None
 
     def close_sensors(self):
+        REGISTRY.remove_collector(self.collect_metrics)
+        if self.supervisor:
+            self.supervisor.close()
+        self.stop_recording()
+        if self.replay:
+            self.replay.close()
+        if self.selector_ingest:
+            self.selector_ingest.close()
         for sensor in self.sensors:
             sensor.close()
+        if self.stream:
+            self.stream.close()
 
 class LogicHandler:
-    def __init__(self):
-        self.sensor_manager = SensorManager()
+    # ingest_mode is "threads" (one reader thread per port), "selector"
+    # (a single thread multiplexing every port, POSIX only) or "shared"
+    # (read the samples ingest_daemon.py publishes under stream_name).
+    # record/replay name a session file; by default they come from the
+    # MACPARKMAN_RECORD / MACPARKMAN_REPLAY environment variables so display.py
+    # and app.py can record or replay without changes, and likewise the mode
+    # from MACPARKMAN_INGEST and the stream from MACPARKMAN_STREAM. Threshold
+    # crossings are captured to events_dir (MACPARKMAN_EVENTS, default ./events).
+    # Sensor calibration and filters come from the calibration file
+    # (MACPARKMAN_CALIBRATION, default ./calibration.json) when there is one.
+    # groups names the columns sensors are summed into (MACPARKMAN_GROUPS,
+    # comma-separated, default external,internal; in shared mode the
+    # daemon's); every per-column result below comes back as a tuple in that order.
+    # thresholds are each group's [green, yellow] levels (MACPARKMAN_THRESHOLDS,
+    # see configured_thresholds); impacts and events are what passes yellow.
+    def __init__(self, ingest_mode=None, devices=None, record=None, replay=None, replay_speed=None, events_dir=None, stream_name=None, calibration=None, groups=None, thresholds=None):
+        ingest_mode = ingest_mode or os.environ.get("MACPARKMAN_INGEST", "threads")
+        self.groups = configured_groups(groups)
+        self.calibration_path = calibration or os.environ.get("MACPARKMAN_CALIBRATION", "calibration.json")
+        self.calibration = Calibration.load(self.calibration_path) if os.path.exists(self.calibration_path) else Calibration()
+        record = record or os.environ.get("MACPARKMAN_RECORD")
+        replay = replay or os.environ.get("MACPARKMAN_REPLAY")
+        if replay_speed is None:
+            replay_speed = float(os.environ.get("MACPARKMAN_REPLAY_SPEED", 1.0))
+        self.record_path = record
+        stream = None
+        if ingest_mode == "shared":
+            stream = SharedStream.attach(stream_name or os.environ.get("MACPARKMAN_STREAM", STREAM_NAME))
+            # The daemon's groups win, so sensors it puts in a group are summed here too
+            self.groups = stream.groups or self.groups
+        self.sensor_manager = SensorManager(ingest_mode, devices, SessionReplay(replay, replay_speed) if replay else None, stream, self.groups)
+        self.impact_monitor = ImpactMonitor()
+        self.event_capture = EventCapture(events_dir or os.environ.get("MACPARKMAN_EVENTS", "events"))
+        self.thresholds = configured_thresholds(self.groups, thresholds)
+        self.set_thresholds({group: yellow for group, (green, yellow) in self.thresholds.items()})
+        self.fusion = FusionStage(columns=self.groups, filters=self.calibration.filter_bank(FUSION_RATE))
+        self._fused = {column: [] for column in self.fusion.columns}
+        self._fused_limit = 5 * self.fusion.rate  # ticks kept for read_xyz_batches callers
+        self._sensor_batches = {}  # sensor -> active sensor's aligned samples not read yet
+        self._sensor_limit = 4096  # samples per sensor kept for read_sensor_batches callers
+        # Every fused tick's magnitude, for scrolling back through the session
+        # (about 14 MB an hour for both columns)
+        self.history = Pyramid(self.fusion.columns)
+        self.spectra = SpectrumEngine()
+        self._process_seconds = REGISTRY.histogram("macparkman_process_seconds", "Time to fuse and analyse one round of new samples")
 
     def connect_to_sensors(self):
         self.sensor_manager.connect_sensors()
+        if self.record_path:
+            self.sensor_manager.start_recording(self.record_path)
+
+    def process_samples(self):
+        # Put every new sample batch on the shared clock, run it through the
+        # streaming consumers and advance the fused column totals
+        started = time.perf_counter()
+        batches = self.calibration.apply(self.sensor_manager.collect_new_samples("logic"))
+        for sensor, samples in batches.items():
+            aligned = samples.copy()
+            aligned['t'] = self.fusion.add(sensor, samples)
+            if sensor.active:
+                self.impact_monitor.feed(sensor, aligned)
+                self.event_capture.feed(sensor, aligned)
+                self.spectra.feed(sensor, aligned)
+                pending = self._sensor_batches.setdefault(sensor, [])
+                pending.append(aligned)
+                # Trimmed only once it's twice over, so a hidden view costs an occasional copy
+                if sum(len(batch) for batch in pending) > 2 * self._sensor_limit:
+                    pending[:] = [np.concatenate(pending)[-self._sensor_limit:]]
+        now = time.monotonic()
+        self.event_capture.tick(now)
+        for column, ticks in self.fusion.tick(self.sensor_manager.sensors, now).items():
+            self.history.add(column, ticks['t'], self.calculate_magnitudes(ticks))
+            fused = self._fused[column]
+            fused.append(ticks)
+            if sum(len(batch) for batch in fused) > self._fused_limit:
+                fused[:] = [np.concatenate(fused)[-self._fused_limit:]]
+        self._process_seconds.observe(time.perf_counter() - started)
+
+    def pacer(self, interval, idle=1.0):
+        # A Pacer for an output that reads from this handler every `interval`
+        # seconds at most; shared-mode rings are written by the daemon, so
+        # there it polls at that interval instead
+        poll = interval if self.sensor_manager.stream else None
+        return Pacer(interval, idle, linger=2 * LATENCY_MARGIN, poll=poll)
+
+    def auto_zero(self, seconds=ZERO_SECONDS, save=False):
+        # Zero every active sensor on its last `seconds` of raw samples, for
+        # when the rig is standing still; returns the (zeroed, moving) sensors
+        windows = {}
+        for sensor in self.sensor_manager.sensors:
+            if sensor.active and sensor.connected:
+                samples = sensor.ring.window(sensor.ring.capacity)
+                if len(samples):
+                    windows[sensor] = samples[samples['t'] >= samples['t'][-1] - seconds]
+        zeroed, moving = self.calibration.auto_zero(windows)
+        if save and zeroed:
+            self.calibration.save(self.calibration_path)
+        return zeroed, moving
+
+    def set_thresholds(self, thresholds):
+        # Per-group {"external": g, ...} levels for impacts and event capture
+        self.impact_monitor.thresholds = thresholds
+        self.event_capture.thresholds = thresholds
 
     def read_xyz_data(self):
+        # Latest fused totals per group; the sensors' own x/y/z are refreshed too
+        self.process_samples()
+        self.sensor_manager.update_sensors()
+        return self.latest_xyz()
+
+    def latest_xyz(self):
+        # The fused totals per group as of the last processing pass, for a
+        # caller that just ran one through another read_* method
+        return tuple(self.fusion.latest[group] for group in self.groups)
+
+    def read_xyz_batches(self):
+        # Every fused tick since the previous call, one array per group with
+        # t, x, y and z fields on the common grid
+        self.process_samples()
+        self.sensor_manager.update_sensors()
+        batches = []
+        for column in self.groups:
+            fused = self._fused[column]
+            batches.append(np.concatenate(fused) if fused else np.empty(0, dtype=self.fusion.tick_dtype))
+            fused.clear()
+        return tuple(batches)
+
+    def read_sensor_batches(self):
+        # Every sample of each active sensor since the previous call, one
+        # array per sensor with t on the common clock, {sensor: samples}
+        self.process_samples()
         self.sensor_manager.update_sensors()
-        external_xyz = (self.sensor_manager.total_x_external, self.sensor_manager.total_y_external, self.sensor_manager.total_z_external)
-        internal_xyz = (self.sensor_manager.total_x_internal, self.sensor_manager.total_y_internal, self.sensor_manager.total_z_internal)
-        return external_xyz, internal_xyz
+        batches = {sensor: np.concatenate(pending) for sensor, pending in self._sensor_batches.items() if pending}
+        self._sensor_batches.clear()
+        return batches
+
+    def read_spectra(self):
+        # New spectrogram columns of every active sensor since the previous
+        # call; the FFTs only run here, so nothing is spent while no one looks
+        self.process_samples()
+        self.sensor_manager.update_sensors()
+        return self.spectra.update()
 
     def calculate_magnitude(self, xyz):
         return math.sqrt(xyz[0]**2 + xyz[1]**2 + xyz[2]**2)
 
+    def calculate_magnitudes(self, batch):
+        return np.sqrt(batch['x']**2 + batch['y']**2 + batch['z']**2)
+
     def close_sensors(self):
-        self.sensor_manager.close_sensors()
\ No newline at end of file
+        self.sensor_manager.close_sensors()
+        self.event_capture.close()
@@ -0,0 +1,167 @@
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from samples import SAMPLE_DTYPE, SampleRing
+
+STREAM_NAME = "macparkman"
+STREAM_CAPACITY = 65536  # samples per sensor (~65 s at 1 kHz), so slow viewers have plenty of slack
+HEARTBEAT_TIMEOUT = 2.0  # s without a heartbeat before clients treat the daemon as gone
+MAGIC = b"MPKSHM02"
+GROUP_NAME_SIZE = 16  # bytes of a sensor's group name in its record
+
+# Layout of the block: one header, one SENSOR_DTYPE record per sensor, then
+# every sensor's ring of SAMPLE_DTYPE slots. heartbeat and the sample times are
+# time.monotonic(), which is the same system-wide clock in every process.
+# groups is the daemon's comma-separated group names, so clients sum the same columns.
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('capacity', '<i8'), ('sensors', '<i8'), ('pid', '<i8'), ('heartbeat', '<f8'), ('groups', 'S256')], align=True)
+SENSOR_DTYPE = np.dtype([('count', '<i8'), ('port', '<u4'), ('connected', 'u1'), ('active', 'u1'), ('column', f'S{GROUP_NAME_SIZE}'), ('device', 'S64')], align=True)
+
+def _rings_offset(sensors):
+    offset = HEADER_DTYPE.itemsize + sensors * SENSOR_DTYPE.itemsize
+    return offset + -offset % 64
+
+def _open(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach registers with the resource tracker,
+        # which would unlink the daemon's block when this process exits
+        shm = shared_memory.SharedMemory(name)
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class SharedSampleRing(SampleRing):
+    # A SampleRing whose slots and count live in the shared block, so the
+    # daemon's Sensor writes straight into it and clients read it in place
+    def __init__(self, slots, count):
+        self.capacity = len(slots)
+        self.slots = slots
+        self._count = count  # one-element view of this sensor's count field
+
+    @property
+    def count(self):
+        return int(self._count[0])
+
+    @count.setter
+    def count(self, value):
+        self._count[0] = value
+
+class SharedStream:
+    # The ingest daemon's sample rings in one named shared-memory block. The
+    # daemon is the only writer; any number of processes can attach and read
+    # the rings with SampleRing's lock-free protocol, each at its own pace.
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self._adopted = set()  # ports whose daemon-side column and active flag were taken over
+        self.header = np.ndarray(1, HEADER_DTYPE, shm.buf)
+        sensors = int(self.header['sensors'][0])
+        capacity = int(self.header['capacity'][0])
+        self.info = np.ndarray(sensors, SENSOR_DTYPE, shm.buf, offset=HEADER_DTYPE.itemsize)
+        ring_size = capacity * SAMPLE_DTYPE.itemsize
+        self.rings = [
+            SharedSampleRing(
+                np.ndarray(capacity, SAMPLE_DTYPE, shm.buf, offset=_rings_offset(sensors) + i * ring_size),
+                self.info['count'][i:i + 1],
+            )
+            for i in range(sensors)
+        ]
+
+    @classmethod
+    def create(cls, sensors, name=STREAM_NAME, capacity=STREAM_CAPACITY, groups=()):
+        # Names are never cut short: a client would show other groups than
+        # the daemon's, and names differing only past the cut would merge
+        for group in groups:
+            if len(group.encode()) > GROUP_NAME_SIZE:
+                raise ValueError(f"Group name '{group}' is longer than {GROUP_NAME_SIZE} bytes")
+        size = _rings_offset(len(sensors)) + len(sensors) * capacity * SAMPLE_DTYPE.itemsize
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a daemon that didn't shut down cleanly?
+            try:
+                old = cls.attach(name)
+            except ValueError:
+                alive = False
+            else:
+                alive = old.alive()
+                old.close()
+            if alive:
+                raise RuntimeError(f"An ingest daemon is already publishing '{name}'")
+            shm = shared_memory.SharedMemory(name)
+            shm.unlink()
+            shm.close()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        header = np.ndarray(1, HEADER_DTYPE, shm.buf)
+        header['capacity'] = capacity
+        header['sensors'] = len(sensors)
+        header['pid'] = os.getpid()
+        names = ",".join(groups).encode()
+        if len(names) > HEADER_DTYPE['groups'].itemsize:
+            shm.close()
+            shm.unlink()
+            raise ValueError("Group names too long to share")
+        header['groups'] = names
+        del header
+        stream = cls(shm, owner=True)
+        stream.publish(sensors)
+        stream.header['magic'] = MAGIC  # last, so clients never see a half-made block
+        return stream
+
+    @classmethod
+    def attach(cls, name=STREAM_NAME):
+        try:
+            shm = _open(name)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No ingest daemon is publishing '{name}'") from None
+        if bytes(shm.buf[:len(MAGIC)]) != MAGIC:
+            shm.close()
+            raise ValueError(f"'{name}' is not a sensor stream")
+        return cls(shm)
+
+    def publish(self, sensors):
+        # Daemon side: sensor states and the heartbeat, a few times a second
+        for i, sensor in enumerate(sensors):
+            record = self.info[i]
+            record['port'] = sensor.port
+            record['connected'] = sensor.connected
+            record['active'] = sensor.active
+            record['column'] = sensor.column.encode()
+            record['device'] = str(sensor.device).encode()[:SENSOR_DTYPE['device'].itemsize]
+        self.header['heartbeat'] = time.monotonic()
+
+    def alive(self):
+        return time.monotonic() - float(self.header['heartbeat'][0]) < HEARTBEAT_TIMEOUT
+
+    @property
+    def groups(self):
+        names = self.header['groups'][0].decode()
+        return tuple(names.split(",")) if names else ()
+
+    def refresh(self, sensors):
+        # Client side: copy the daemon's view of each sensor onto our stand-ins.
+        # Column and active belong to the client, so a toggle or drag in its
+        # Sensors view sticks; they only start out as the daemon's, once the
+        # daemon has connected the sensor.
+        alive = self.alive()
+        for sensor, record in zip(sensors, self.info):
+            sensor.connected = bool(record['connected']) and alive
+            if sensor.connected and sensor.port not in self._adopted:
+                self._adopted.add(sensor.port)
+                sensor.active = bool(record['active'])
+                sensor.column = record['column'].decode()
+
+    def sensor_info(self):
+        return [(int(record['port']), record['device'].decode()) for record in self.info]
+
+    def close(self):
+        # Every NumPy view into the block has to go before it can be closed
+        for ring in self.rings:
+            ring.slots = ring._count = None
+        self.rings = []
+        self.header = self.info = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,81 @@
+import numpy as np
+
+SPECTRUM_WINDOW = 256  # samples per FFT, ~4 Hz bins at 1 kHz
+SPECTRUM_HOP = 64  # new samples per spectrogram column (75% overlap)
+MAX_COLUMNS = 1024  # columns' worth of samples kept while nobody reads them
+DB_RANGE = (-60.0, 0.0)  # amplitude in dB re 1 g mapped onto the palette
+
+def _palette():
+    # 256 RGB entries from black through blue, red and yellow to white
+    stops = np.array([0, 0.25, 0.5, 0.75, 1.0])
+    colors = np.array([(0, 0, 0), (30, 20, 140), (200, 30, 60), (250, 200, 40), (255, 255, 255)])
+    levels = np.linspace(0, 1, 256)
+    return np.stack([np.interp(levels, stops, colors[:, i]) for i in range(3)], axis=1).astype(np.uint8)
+
+PALETTE = _palette()
+
+class SpectrumEngine:
+    # Spectrogram columns for every sensor it is fed. Samples only queue up
+    # until update(), which turns every full window in the queue into a
+    # column at once: Hann-windowed rffts of x, y and z (each minus its mean)
+    # batched in one NumPy call, their power summed so a resonance shows
+    # whatever axis it is on. The tail that doesn't make a hop yet stays queued.
+    def __init__(self, window=SPECTRUM_WINDOW, hop=SPECTRUM_HOP, max_columns=MAX_COLUMNS):
+        self.window = window
+        self.hop = hop
+        self.bins = window // 2 + 1
+        self._taper = np.hanning(window)
+        # A sine of amplitude A g comes out as A
+        self._scale = 2 / self._taper.sum()
+        self._limit = window + hop * max_columns
+        self._pending = {}  # sensor -> list of (n, 4) t, x, y, z arrays
+        self._counts = {}
+        self.rates = {}  # sensor -> estimated samples per second
+
+    def feed(self, sensor, samples):
+        block = np.empty((len(samples), 4))
+        for i, name in enumerate(('t', 'x', 'y', 'z')):
+            block[:, i] = samples[name]
+        pending = self._pending.setdefault(sensor, [])
+        pending.append(block)
+        self._counts[sensor] = self._counts.get(sensor, 0) + len(block)
+        if self._counts[sensor] > 2 * self._limit:
+            # Nobody has asked for a while; only the newest columns could be shown anyway
+            pending[:] = [np.concatenate(pending)[-self._limit:]]
+            self._counts[sensor] = self._limit
+
+    def update(self):
+        # {sensor: (columns, rate)} for sensors with at least one new column:
+        # (k, bins) float32 dB re 1 g, oldest first, lowest frequency first
+        results = {}
+        for sensor, pending in self._pending.items():
+            if self._counts[sensor] < self.window:
+                continue
+            queued = np.concatenate(pending)
+            frames = (len(queued) - self.window) // self.hop + 1
+            used = (frames - 1) * self.hop + self.window
+
+            t = queued[:used, 0]
+            if t[-1] > t[0]:
+                rate = (used - 1) / (t[-1] - t[0])
+                previous = self.rates.get(sensor)
+                self.rates[sensor] = rate if previous is None else 0.9 * previous + 0.1 * rate
+
+            windows = np.lib.stride_tricks.sliding_window_view(queued[:used, 1:], self.window, axis=0)[::self.hop]
+            windows = windows - windows.mean(axis=-1, keepdims=True)
+            power = (np.abs(np.fft.rfft(windows * self._taper, axis=-1)) ** 2).sum(axis=1)
+            amplitude = np.sqrt(power) * self._scale
+            columns = (20 * np.log10(np.maximum(amplitude, 1e-9))).astype(np.float32)
+
+            rest = queued[frames * self.hop:]
+            pending[:] = [rest]
+            self._counts[sensor] = len(rest)
+            results[sensor] = (columns, self.rates.get(sensor, 0.0))
+        return results
+
+def colorize(columns, rows):
+    # (k, bins) dB columns as a (k, len(rows), 3) RGB array for
+    # pygame.surfarray; rows picks the bin shown on each pixel row, top first
+    low, high = DB_RANGE
+    levels = np.clip((columns[:, rows] - low) * (255 / (high - low)), 0, 255).astype(np.uint8)
+    return PALETTE[levels]
@@ -1,7 +1,65 @@
 const socket = io();
+const TRACE_SECONDS = 10;
+const trace = document.getElementById('trace');
+const envelope = [[], []];  // external, internal magnitude: [min, max] per pixel
+
+function drawTrace() {
+    const context = trace.getContext('2d');
+    context.fillStyle = 'black';
+    context.fillRect(0, 0, trace.width, trace.height);
+    let scale = 2;
+    for (const points of envelope) {
+        for (const [, high] of points) scale = Math.max(scale, high);
+    }
+    const half = trace.height / 2;
+    ['lime', 'orange'].forEach(function(color, row) {
+        context.strokeStyle = color;
+        context.beginPath();
+        const points = envelope[row];
+        const offset = trace.width - points.length;
+        points.forEach(function([low, high], i) {
+            context.moveTo(offset + i + 0.5, (row + 1) * half - low / scale * half);
+            context.lineTo(offset + i + 0.5, (row + 1) * half - high / scale * half - 1);
+        });
+        context.stroke();
+    });
+}
+
+socket.on('connect', function() {
+    // Min/max envelope of both magnitudes, one point per pixel over TRACE_SECONDS
+    socket.emit('subscribe', {mode: 'envelope', points_per_second: trace.width / TRACE_SECONDS});
+})
+socket.on('frame', function(buffer) {
+    // Header: "MPKF", version, mode, channel count, point count, t0, dt,
+    // then float32 data channel by channel (min, max pairs in envelope mode)
+    const view = new DataView(buffer);
+    const mode = view.getUint8(5);
+    const channels = view.getUint16(6, true);
+    const points = view.getUint32(8, true);
+    const width = mode === 1 ? 2 : 1;
+    const data = new Float32Array(buffer, 28, channels * points * width);
+    // Magnitudes of the first two groups; there are four channels per group
+    for (const [trace_channel, channel] of [[0, 3], [1, 7]]) {
+        if (channel >= channels) continue;
+        const values = data.subarray(channel * points * width, (channel + 1) * points * width);
+        for (let i = 0; i < points; i++) {
+            envelope[trace_channel].push([values[i * width], values[i * width + width - 1]]);
+        }
+        envelope[trace_channel].splice(0, envelope[trace_channel].length - trace.width);
+    }
+    drawTrace();
+})
 
 socket.on('sensor_data', function(data) {
     document.getElementById('x').innerText = data.x.toFixed(2);
     document.getElementById('y').innerText = data.y.toFixed(2);
     document.getElementById('z').innerText = data.z.toFixed(2);
+})
+socket.on('impact', function(impact) {
+    const item = document.createElement('li');
+    item.innerText = `COM${impact.port} (${impact.column}): ${impact.peak_g.toFixed(1)} g peak, ` +
+        `HIC15 ${impact.hic15.toFixed(0)}, HIC36 ${impact.hic36.toFixed(0)}, ` +
+        `${(impact.duration_above * 1000).toFixed(1)} ms above threshold`;
+    const list = document.getElementById('impacts');
+    list.insertBefore(item, list.firstChild);
 })
\ No newline at end of file
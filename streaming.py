@@ -0,0 +1,78 @@
+import struct
+import numpy as np
+
+AXES = ("x", "y", "z", "magnitude")
+
+def channel_names(groups):
+    # Every fused tick, as the columns of one float32 row: four per group
+    return tuple(f"{group}_{axis}" for group in groups for axis in AXES)
+
+CHANNELS = channel_names(("external", "internal"))
+
+# Frame layout, little-endian: magic, version, mode, channel count, point
+# count, start time and seconds per point, then float32 data channel by
+# channel. A "full" point is one value; an "envelope" point is a min, max pair.
+FRAME_MAGIC = b"MPKF"
+FRAME_HEADER = struct.Struct("<4sBBHIdd")
+MODES = {"full": 0, "envelope": 1}
+
+def channel_rows(*batches):
+    # (n, 4 * groups) float32 rows from read_xyz_batches' tick arrays
+    rows = np.empty((len(batches[0]), len(AXES) * len(batches)), dtype=np.float32)
+    for offset, batch in zip(range(0, rows.shape[1], len(AXES)), batches):
+        rows[:, offset] = batch['x']
+        rows[:, offset + 1] = batch['y']
+        rows[:, offset + 2] = batch['z']
+        rows[:, offset + 3] = np.sqrt(batch['x'] ** 2 + batch['y'] ** 2 + batch['z'] ** 2)
+    return rows
+
+def pack_frame(mode, t0, dt, data):
+    # data: (points, channels) for "full", (points, channels, 2) for "envelope"
+    header = FRAME_HEADER.pack(FRAME_MAGIC, 1, MODES[mode], data.shape[1], data.shape[0], t0, dt)
+    return header + np.ascontiguousarray(np.moveaxis(data, 1, 0), dtype='<f4').tobytes()
+
+class Decimator:
+    # One dashboard client's view of the stream: every tick ("full") or a
+    # min/max envelope with `points_per_second` buckets per second, e.g. the
+    # trace's width in pixels over the seconds it shows. Ticks that don't
+    # fill a bucket yet wait for the next batch.
+    def __init__(self, rate, mode="envelope", points_per_second=100, channels=len(CHANNELS)):
+        if mode not in MODES:
+            raise ValueError(f"Unknown stream mode: {mode}")
+        if points_per_second <= 0:
+            raise ValueError("points_per_second must be positive")
+        self.rate = rate
+        self.mode = mode
+        self.channels = channels
+        self.bucket = 1 if mode == "full" else max(1, round(rate / points_per_second))
+        self._pending = np.empty((0, channels), dtype=np.float32)
+        self._pending_t = None
+
+    def frame(self, t0, rows):
+        # Packed frame for ticks starting at time t0, or None if no bucket filled
+        # A gap in the ticks (the stream paused) leaves nothing to join onto
+        if not len(self._pending) or abs(t0 - self._pending_t - len(self._pending) / self.rate) > 0.5 / self.rate:
+            self._pending = self._pending[:0]
+            self._pending_t = t0
+        rows = np.concatenate((self._pending, rows)) if len(self._pending) else rows
+        points = len(rows) // self.bucket
+        used = points * self.bucket
+        start, self._pending = self._pending_t, rows[used:]
+        self._pending_t = start + used / self.rate
+        if not points:
+            return None
+        if self.mode == "full":
+            return pack_frame("full", start, 1 / self.rate, rows[:used])
+        buckets = rows[:used].reshape(points, self.bucket, self.channels)
+        envelope = np.stack((buckets.min(axis=1), buckets.max(axis=1)), axis=-1)
+        return pack_frame("envelope", start, self.bucket / self.rate, envelope)
+
+def tick_encoder(decimator=None):
+    # A hub client's prepare(): the published 'ticks' (t0, rows) become this
+    # client's own 'frame', or nothing until it subscribes; other events pass
+    def prepare(event, payload):
+        if event != 'ticks':
+            return event, payload
+        frame = decimator.frame(*payload) if decimator else None
+        return ('frame', frame) if frame else None
+    return prepare
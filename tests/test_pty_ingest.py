@@ -0,0 +1,75 @@
+import calendar
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensors_logic import SensorManager
+from transports import PtyTransport
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="pty pairs are POSIX only")
+
+LINES = [
+    (b"10/18/2026,12:34:56.78", 0.01, -0.02, 1.00),
+    (b"10/18/2026,12:34:56.79", 0.50, 0.25, 0.75),
+    (b"10/18/2026,12:34:56.80", -1.25, 2.00, -0.50),
+]
+
+def collect(manager, count, timeout=5.0):
+    # Everything the manager's sensors read until `count` samples are in
+    batches = []
+    deadline = time.monotonic() + timeout
+    while sum(len(batch) for batch in batches) < count and time.monotonic() < deadline:
+        for samples in manager.collect_new_samples("test").values():
+            batches.append(samples)
+        time.sleep(0.01)
+    return np.concatenate(batches) if batches else np.empty(0)
+
+@pytest.mark.parametrize("mode", ["threads", "selector"])
+def test_lines_written_to_a_pty_come_out_as_samples(mode):
+    transport = PtyTransport()
+    manager = SensorManager(mode, [transport])
+    manager.connect_sensors()
+    try:
+        sensor = manager.sensors[0]
+        assert sensor.connected
+        # A partial line is held back until its newline arrives
+        data = b"".join(b"%s,%.2f,%.2f,%.2f,100.000,\r\n" % line for line in LINES)
+        before = time.monotonic()
+        transport.write(data[:50])
+        time.sleep(0.05)
+        transport.write(data[50:])
+        samples = collect(manager, len(LINES))
+    finally:
+        manager.close_sensors()
+
+    assert len(samples) == len(LINES)
+    assert sensor.malformed_lines == 0
+    np.testing.assert_allclose(np.column_stack((samples['x'], samples['y'], samples['z'])),
+                               [line[1:] for line in LINES], atol=1e-6)
+    day = calendar.timegm((2026, 10, 18, 12, 34, 56, 0, 0, 0))
+    np.testing.assert_allclose(samples['device_t'], [day + 0.78, day + 0.79, day + 0.80], atol=1e-6)
+    assert np.all(np.diff(samples['t']) >= 0)
+    assert before <= samples['t'][0] and samples['t'][-1] <= time.monotonic()
+
+@pytest.mark.parametrize("mode", ["threads", "selector"])
+def test_malformed_pty_lines_are_counted_not_parsed(mode):
+    transport = PtyTransport()
+    manager = SensorManager(mode, [transport])
+    manager.connect_sensors()
+    try:
+        transport.write(b"garbage\r\n10/18/2026,12:34:56.78,0.10,0.20,0.30,100.000,\r\n")
+        samples = collect(manager, 1)
+        deadline = time.monotonic() + 2
+        while not manager.sensors[0].malformed_lines and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        manager.close_sensors()
+
+    assert len(samples) == 1
+    np.testing.assert_allclose([samples['x'][0], samples['y'][0], samples['z'][0]], [0.1, 0.2, 0.3], atol=1e-6)
+    assert manager.sensors[0].malformed_lines == 1
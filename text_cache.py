@@ -0,0 +1,28 @@
+import pygame
+from collections import OrderedDict
+
+MAX_CACHED_TEXT = 512
+
+_fonts = {}
+_rendered = OrderedDict()
+
+def get_font(size):
+    # One shared Font per size instead of loading a new one on every draw
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.Font(None, size)
+    return font
+
+def render_text(text, color, size=36):
+    # Rendered text surfaces keyed by (font size, text, color); the least
+    # recently used ones are evicted once MAX_CACHED_TEXT is reached
+    key = (size, text, color)
+    surface = _rendered.get(key)
+    if surface is None:
+        surface = get_font(size).render(text, True, color)
+        _rendered[key] = surface
+        if len(_rendered) > MAX_CACHED_TEXT:
+            _rendered.popitem(last=False)
+    else:
+        _rendered.move_to_end(key)
+    return surface
@@ -0,0 +1,246 @@
+import abc
+import math
+import os
+import threading
+import time
+import numpy as np
+import serial
+
+class Transport(abc.ABC):
+    # Where a Sensor's bytes come from. read() returns whatever bytes are
+    # available, blocking for at most about a second when there are none, and
+    # raises EOFError once the source is gone for good. fileno() is what the
+    # selector ingest waits on. Transports that can simply be opened again
+    # after the device drops out are reconnectable. serial_number is the USB
+    # serial number when the OS reports one; it follows the board from one
+    # device name to the next.
+    name = "transport"
+    reconnectable = False
+    serial_number = None
+
+    def open(self):
+        pass
+
+    @abc.abstractmethod
+    def read(self):
+        pass
+
+    @abc.abstractmethod
+    def fileno(self):
+        pass
+
+    def close(self):
+        pass
+
+class SerialTransport(Transport):
+    reconnectable = True
+
+    def __init__(self, device, baud_rate=115200, serial_number=None):
+        self.name = device
+        self.device = device
+        self.baud_rate = baud_rate
+        self.serial_number = serial_number
+        self.ser = None
+
+    def open(self):
+        # Discovery hands over ports it already opened
+        if self.ser is None or not self.ser.is_open:
+            self.ser = serial.Serial(self.device, self.baud_rate, timeout=1)
+
+    def read(self):
+        return self.ser.read(self.ser.in_waiting or 1)
+
+    def fileno(self):
+        return self.ser.fileno()
+
+    def close(self):
+        if self.ser:
+            self.ser.close()
+
+class PtyTransport(Transport):
+    # A pty pair: the sensor reads the slave end exactly like a real tty while
+    # a test or benchmark plays the board by calling write(). POSIX only.
+    def __init__(self, name="pty"):
+        self.name = name
+        self.master_fd = None
+        self.slave_fd = None
+
+    def open(self):
+        import pty
+        import tty
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        self.name = os.ttyname(self.slave_fd)
+
+    def write(self, data):
+        os.write(self.master_fd, data)
+
+    def read(self):
+        import select
+        ready, _, _ = select.select([self.slave_fd], [], [], 1)
+        return os.read(self.slave_fd, 65536) if ready else b""
+
+    def fileno(self):
+        return self.slave_fd
+
+    def close(self):
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+
+class GeneratedTransport(Transport):
+    # Base for transports whose bytes come from a "device" thread in this
+    # process. The device writes lines into a pipe at `rate` lines per second;
+    # like a UART overrun, lines that don't fit because the reader fell behind
+    # are lost and counted in dropped_lines. With rate=None it writes as fast
+    # as the reader keeps up instead.
+    def __init__(self, rate, name):
+        self.rate = rate
+        self.name = name
+        self.lines_sent = 0
+        self.dropped_lines = 0
+        self.sent_log = []  # (lines_sent, monotonic time) after every write
+        self._read_fd = None
+        self._write_fd = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def open(self):
+        self._read_fd, self._write_fd = os.pipe()
+        if self.rate:
+            os.set_blocking(self._write_fd, False)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name} device", daemon=True)
+        self._thread.start()
+
+    @abc.abstractmethod
+    def lines(self, index, count):
+        # Return (bytes, line_count) for up to `count` lines starting at line
+        # `index`, or None once there is nothing left to send
+        pass
+
+    def _run(self):
+        started = time.monotonic()
+        sent = 0
+        try:
+            while not self._stop.is_set():
+                due = int((time.monotonic() - started) * self.rate) - sent if self.rate else 1024
+                if due <= 0:
+                    self._stop.wait(min(1 / self.rate, 0.001))
+                    continue
+                generated = self.lines(sent, due)
+                if generated is None:
+                    break
+                chunk, count = generated
+                self._write(chunk)
+                sent += count
+                self.lines_sent = sent
+                self.sent_log.append((sent, time.monotonic()))
+        except OSError:
+            pass
+        # Closing our end shows up as EOF on the reader's side
+        os.close(self._write_fd)
+        self._write_fd = None
+
+    def _write(self, chunk):
+        view = memoryview(chunk)
+        while view:
+            try:
+                written = os.write(self._write_fd, view)
+            except BlockingIOError:
+                written = 0
+            if self.rate and written < len(view):
+                # The reader fell behind and the pipe is full
+                self.dropped_lines += view[written:].tobytes().count(b"\n")
+                return
+            view = view[written:]
+
+    def read(self):
+        data = os.read(self._read_fd, 65536)
+        if not data:
+            raise EOFError(self.name)
+        return data
+
+    def fileno(self):
+        return self._read_fd
+
+    def close(self):
+        self._stop.set()
+        # Closing the read end also frees a device thread stuck in a blocking write
+        if self._read_fd is not None:
+            os.close(self._read_fd)
+            self._read_fd = None
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+class FileTransport(GeneratedTransport):
+    # Replays a CSV log captured from a board, e.g. the OpenLog SD card's
+    # dataLog file, at `rate` lines per second (None: as fast as it's read)
+    def __init__(self, path, rate=None, loop=False):
+        super().__init__(rate, os.path.basename(path))
+        self.path = path
+        self.loop = loop
+        with open(path, 'rb') as file:
+            self._lines = [line for line in file.read().splitlines(keepends=True) if line.strip()]
+
+    def lines(self, index, count):
+        if not self._lines or (index >= len(self._lines) and not self.loop):
+            return None
+        picked = [self._lines[i % len(self._lines)] for i in range(index, index + count)]
+        if not self.loop:
+            picked = picked[:len(self._lines) - index]
+        return b"".join(picked), len(picked)
+
+class SyntheticTransport(GeneratedTransport):
+    # Stands in for an OpenLog Artemis: emits Artemis-format CSV lines
+    # ("rtcDate,rtcTime,aX,aY,aZ,output_Hz,") at `rate` Hz with gravity on Z
+    # plus noise, and a half-sine impact whenever inject_impact() is called.
+    # With rate=None each chunk's lines are stamped evenly between the
+    # previous chunk and the moment it was generated.
+    def __init__(self, rate=100, name="synthetic", noise=0.02, seed=None):
+        super().__init__(rate, name)
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._impacts = []
+        self._impacts_lock = threading.Lock()
+        self._clock_start = time.time()
+        self._last_wall = self._clock_start
+
+    def inject_impact(self, peak=50.0, duration=0.01, direction=(1.0, 0.0, 0.0)):
+        # Starts at the next generated line
+        start = self._clock_start + self.lines_sent / self.rate if self.rate is not None else time.time()
+        with self._impacts_lock:
+            self._impacts.append((start, peak, duration, np.asarray(direction, dtype=float) / np.linalg.norm(direction)))
+
+    def lines(self, index, count):
+        if self.rate is None:
+            now = time.time()
+            wall = np.linspace(self._last_wall, now, count + 1)[1:]
+            self._last_wall = now
+        else:
+            wall = self._clock_start + np.arange(index, index + count) / self.rate
+        xyz = self._rng.normal(0, self.noise, (count, 3))
+        xyz[:, 2] += 1.0
+        with self._impacts_lock:
+            impacts = self._impacts
+            # Forget impacts that will have fully played out after this chunk
+            self._impacts = [impact for impact in impacts if impact[0] + impact[2] > wall[-1]]
+        for start, peak, duration, direction in impacts:
+            phase = (wall - start) / duration
+            inside = (phase >= 0) & (phase < 1)
+            if inside.any():
+                xyz[inside] += np.outer(peak * np.sin(math.pi * phase[inside]), direction)
+
+        # Rounded to hundredths before splitting into fields, so 59.996 s
+        # carries into the next minute (and day) instead of printing 60.00
+        centis = np.round(wall * 100).astype(np.int64)
+        days, centis = np.divmod(centis, 8640000)
+        # Each line gets its own date, so a chunk can run past midnight
+        dates = {day: time.strftime("%m/%d/%Y", time.gmtime(day * 86400)).encode() for day in np.unique(days).tolist()}
+        chunk = b"".join(
+            b"%s,%02d:%02d:%02d.%02d,%.2f,%.2f,%.2f,%.3f,\r\n" % (dates[day], c // 360000, c // 6000 % 60, c // 100 % 60, c % 100, x, y, z, self.rate or 0)
+            for day, c, (x, y, z) in zip(days.tolist(), centis.tolist(), xyz.tolist())
+        )
+        return chunk, count